@@ -0,0 +1,296 @@
+#!/usr/bin/python3
+#
+# atlas.py
+#
+# Strategy atlas: the strategy and optimal EV tables of many shoe
+# compositions (or true counts) in one binary file, read back through mmap
+# so a lookup is a NumPy view into the file and every process on a host
+# shares one copy in the page cache
+#
+# Example:
+#   python3 atlas.py counts.atlas --counts -10 10 --step 0.5
+#   python3 atlas.py shoes.atlas --compositions shoes.txt --workers 4
+#
+# A compositions file holds one composition per line: the count (or weight)
+# of each card in DISTINCT, separated by spaces or commas. Each composition
+# is played as an infinite deck of its proportions, as in counting.py.
+#
+# Layout: MAGIC, the length of the header as a little endian uint64, the
+# header (JSON: rules, row and column labels, plays and the offset, dtype
+# and shape of each array), then each array of ARRAYS aligned to ALIGN
+# bytes. An entry is one composition:
+#   prob       float64 (entries, cards)       card probabilities
+#   true_count float64 (entries,)             true count (NaN if not built
+#                                             from a count)
+#   advantage  float64 (entries,)
+#   optimal    float64 (entries, rows, columns)
+#   strategy   uint8   (entries, rows, columns)  index into PLAYS
+#                                             (EMPTY_PLAY for an empty cell)
+#
+
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import easybj
+from easybj import DISTINCT, DEALER_CODE, PLAYER_CODE, rank_probabilities
+from counting import HI_LO, true_count_weights
+from rules import Rules
+from sweep import RULE_TYPES
+from table import EMPTY_INDEX
+
+# first bytes of an atlas file
+MAGIC = b'EBJATLS1'
+
+# alignment of each array in the file
+ALIGN = 64
+
+# every play of the strategy table
+PLAYS = ('S', 'H', 'Dh', 'Ds', 'Rh', 'Rs', 'P')
+
+# strategy cell of an empty cell
+EMPTY_PLAY = 255
+
+# arrays of an atlas in file order: name to (dtype, shape after entries)
+ARRAYS = {
+    'prob': ('<f8', (len(DISTINCT),)),
+    'true_count': ('<f8', ()),
+    'advantage': ('<f8', ()),
+    'optimal': ('<f8', (len(PLAYER_CODE), len(DEALER_CODE))),
+    'strategy': ('u1', (len(PLAYER_CODE), len(DEALER_CODE))),
+}
+
+# return the strategy table of a calculator as indices into PLAYS (its pool
+# of values can hold partial plays no cell is left with, eg 'D')
+def play_indices(strategy):
+    pool = np.array([ PLAYS.index(v) if v in PLAYS else EMPTY_PLAY
+        for v in strategy.values ] + [ EMPTY_PLAY ], dtype=np.uint8)
+    plays = pool[np.where(strategy.table == EMPTY_INDEX, -1, strategy.table)]
+    if ((plays == EMPTY_PLAY) & (strategy.table != EMPTY_INDEX)).any():
+        raise ValueError("strategy has a play not in %s"%", ".join(PLAYS))
+    return plays
+
+# return the advantage, optimal EVs and strategy of a run of card
+# probabilities (runs in a worker process), bypassing the result cache of
+# calculate() that a run of one-off compositions would only churn
+def _build_chunk(args):
+    rules, probs = args
+    out = []
+    for prob in probs:
+        calc = easybj.Calculator(rules, prob=prob)
+        calc.run('advantage')
+        calc.run('strategy')
+        out.append((calc.advantage, calc.optimal_ev.table, play_indices(calc.strategy)))
+    return out
+
+#
+# Builds an atlas file
+#
+# path: file to write
+# weights: card weights of each composition (see rank_probabilities())
+# rules: game rules of an infinite deck (rules.decks must be None)
+# true_counts: true count of each composition (None if not built from
+#              counts)
+# workers: number of worker processes (all cores if None, 1 builds in this
+#          process)
+#
+# Entries are written to the file as they come in, so an atlas of any
+# size is built in constant memory.
+#
+def build(path, weights, rules=None, true_counts=None, workers=None):
+    rules = Rules() if rules is None else rules
+    if rules.decks is not None:
+        raise ValueError("an atlas is built for infinite decks of each composition")
+    probs = [ rank_probabilities(w) for w in weights ]
+    n = len(probs)
+    if true_counts is not None and len(true_counts) != n:
+        raise ValueError("expected a true count for each composition")
+
+    # header with the place of each array
+    arrays = {}
+    offset = 0
+    for name, (dtype, shape) in ARRAYS.items():
+        arrays[name] = { 'dtype': dtype, 'shape': [ n ] + list(shape),
+            'offset': offset }
+        offset += -(-np.dtype(dtype).itemsize * n * int(np.prod(shape)) // ALIGN) * ALIGN
+    header = { 'rules': rules._asdict(), 'rows': PLAYER_CODE,
+        'columns': DEALER_CODE, 'cards': DISTINCT, 'plays': PLAYS,
+        'arrays': arrays }
+    text = json.dumps(header).encode()
+    start = -(-(len(MAGIC) + 8 + len(text)) // ALIGN) * ALIGN
+    with open(path, 'wb') as f:
+        f.write(MAGIC + struct.pack('<Q', len(text)) + text)
+        f.truncate(start + offset)
+    if not n:
+        return
+
+    views = { name: np.memmap(path, a['dtype'], 'r+', start + a['offset'],
+        tuple(a['shape'])) for name, a in arrays.items() }
+    views['prob'][:] = probs
+    views['true_count'][:] = np.nan if true_counts is None else true_counts
+
+    # contiguous runs of compositions, a few per worker
+    workers = workers or os.cpu_count() or 1
+    size = max(1, min(64, -(-n // (workers * 4))))
+    tasks = [ (rules, probs[i:i+size]) for i in range(0, n, size) ]
+    if workers == 1:
+        chunks = map(_build_chunk, tasks)
+    else:
+        pool = ProcessPoolExecutor(workers)
+        chunks = pool.map(_build_chunk, tasks)
+    try:
+        i = 0
+        for chunk in chunks:
+            for advantage, optimal, strategy in chunk:
+                views['advantage'][i] = advantage
+                views['optimal'][i] = optimal
+                views['strategy'][i] = strategy
+                i += 1
+    finally:
+        if workers != 1:
+            pool.shutdown()
+    for v in views.values():
+        v.flush()
+
+#
+# Builds an atlas of true counts (see counting.true_count_weights())
+#
+def build_counts(path, true_counts, rules=None, tags=HI_LO, workers=None):
+    true_counts = [ float(t) for t in true_counts ]
+    build(path, [ true_count_weights(t, tags) for t in true_counts ], rules,
+        true_counts, workers)
+
+#
+# A read-only atlas file. Every array of ARRAYS is an attribute holding a
+# view into the mapped file (nothing is copied), eg atlas.strategy[i] is
+# the strategy of entry i as indices into atlas.plays.
+#
+class Atlas:
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError("%s is not an atlas file"%path)
+            length, = struct.unpack('<Q', f.read(8))
+            header = json.loads(f.read(length))
+            start = -(-(len(MAGIC) + 8 + length) // ALIGN) * ALIGN
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self.rules = Rules(**header['rules'])
+        self.rows = tuple(header['rows'])
+        self.columns = tuple(header['columns'])
+        self.plays = tuple(header['plays'])
+        self.yindex = { p: i for i, p in enumerate(self.rows) }
+        self.xindex = { d: i for i, d in enumerate(self.columns) }
+        for name, a in header['arrays'].items():
+            count = int(np.prod(a['shape']))
+            setattr(self, name, np.frombuffer(self.map, a['dtype'], count,
+                start + a['offset']).reshape(a['shape']))
+        self.entries = len(self.prob)
+
+        # entries built from a true count in order of the count
+        counted = np.flatnonzero(~np.isnan(self.true_count))
+        self.count_order = counted[np.argsort(self.true_count[counted], kind='stable')]
+        self.sorted_counts = self.true_count[self.count_order]
+
+    def __len__(self):
+        return self.entries
+
+    # return the entry of the true count closest to a true count
+    def nearest_count(self, true_count):
+        counts = self.sorted_counts
+        if not len(counts):
+            raise ValueError("atlas is not built from true counts")
+        j = int(np.searchsorted(counts, true_count))
+        if j == len(counts) or (j > 0 and
+                true_count - counts[j-1] <= counts[j] - true_count):
+            j -= 1
+        return int(self.count_order[j])
+
+    # return the entry whose card probabilities are closest to those of a
+    # composition (card weights as rank_probabilities() takes)
+    def nearest(self, weights):
+        prob = np.array(rank_probabilities(weights))
+        return int(np.argmin(np.abs(self.prob - prob).sum(axis=1)))
+
+    # return the play of a hand of an entry (None for an empty cell)
+    def play(self, i, p, d):
+        k = self.strategy[i, self.yindex[p], self.xindex[d]]
+        return None if k == EMPTY_PLAY else self.plays[k]
+
+    # return the optimal EV of a hand of an entry
+    def ev(self, i, p, d):
+        return float(self.optimal[i, self.yindex[p], self.xindex[d]])
+
+    #
+    # Drops the views of the atlas and unmaps the file. A view still held
+    # elsewhere (eg s = atlas.strategy[0]) keeps the file mapped until it
+    # is released, when garbage collection unmaps it. Closing twice does
+    # nothing.
+    #
+    def close(self):
+        if self.map is None:
+            return
+        # the views must go before the map they point into
+        for name in ARRAYS:
+            self.__dict__.pop(name, None)
+        try:
+            self.map.close()
+        except BufferError:
+            pass
+        self.map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+# return the card weights of each line of a compositions file
+def read_compositions(path):
+    with open(path) as f:
+        return [ tuple(float(v) for v in line.replace(',', ' ').split())
+            for line in f if line.strip() ]
+
+#
+# Parses command line and builds an atlas
+#
+def main(argv):
+    parser = argparse.ArgumentParser(prog=argv[0],
+        description="Build a strategy atlas of many shoe compositions.")
+    parser.add_argument('output', help="atlas file to write")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--counts', type=float, nargs=2, metavar=('LOW', 'HIGH'),
+        help="range of true counts")
+    source.add_argument('--compositions', help="file of card counts, one shoe a line")
+    parser.add_argument('--step', type=float, default=1.,
+        help="step between true counts (default: 1)")
+    parser.add_argument('--workers', type=int, default=None,
+        help="worker processes (default: all cores)")
+    for name in Rules._fields:
+        if name != 'decks':
+            parser.add_argument('--' + name, type=RULE_TYPES[name],
+                default=Rules._field_defaults[name])
+    args = parser.parse_args(argv[1:])
+
+    rules = Rules(**{ name: getattr(args, name) for name in Rules._fields
+        if name != 'decks' })
+    if args.counts is not None:
+        low, high = args.counts
+        counts = np.arange(round((high - low) / args.step) + 1) * args.step + low
+        build_counts(args.output, counts, rules, workers=args.workers)
+    else:
+        build(args.output, read_compositions(args.compositions), rules,
+            workers=args.workers)
+    with Atlas(args.output) as atlas:
+        print("%s: %d entries, %d bytes"%(args.output, len(atlas),
+            os.path.getsize(args.output)))
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,138 @@
+#
+# bench
+#
+# Benchmarks of easybj.calculate() and of each stage of the calculator
+#
+# Every case is a fixed rule set and shoe. For each case the suite
+# measures the wall-clock time of a full calculation and of every stage
+# (each stage timed after the stages it needs have run), over several
+# repeats, then the tracemalloc peak memory of the whole calculation and of
+# every stage in one more run. Results are saved as JSON and can be
+# compared against a stored baseline run with a regression threshold.
+#
+# Run from the Part2 directory:
+#   python3 -m bench run -o bench-new.json
+#   python3 -m bench compare bench-baseline.json bench-new.json
+#
+
+import json
+import platform
+import statistics
+import time
+import tracemalloc
+
+import numpy as np
+
+import easybj
+from rules import Rules
+
+# benchmark cases: name -> rules (the shoe is given by rules.decks)
+CASES = {
+    'infinite': Rules(),
+    'infinite-s17-6to5': Rules(hit_soft17=False, blackjack_pays=1.2),
+    'infinite-nosurrender-1split': Rules(surrender=False, max_splits=1),
+    'decks1': Rules(decks=1),
+    'decks6': Rules(decks=6),
+}
+
+# stages in the order they run
+STAGE_ORDER = [ 'initial', 'dealer', 'stand', 'hit', 'double', 'split',
+    'optimal', 'strategy', 'advantage' ]
+
+# return the wall-clock time of every stage (and the total) of one run
+def time_stages(rules):
+    times = {}
+    start = time.perf_counter()
+    calc = easybj.make_calculator(rules)
+    times['setup'] = time.perf_counter() - start
+    for stage in STAGE_ORDER:
+        t = time.perf_counter()
+        calc.run(stage)
+        times[stage] = time.perf_counter() - t
+    times['total'] = time.perf_counter() - start
+    return times
+
+# return the tracemalloc peak memory (bytes) of every stage of one run
+def memory_stages(rules):
+    peaks = {}
+    tracemalloc.start()
+    try:
+        calc = easybj.make_calculator(rules)
+        peaks['setup'] = tracemalloc.get_traced_memory()[1]
+        for stage in STAGE_ORDER:
+            tracemalloc.reset_peak()
+            calc.run(stage)
+            peaks[stage] = tracemalloc.get_traced_memory()[1]
+        peaks['total'] = max(peaks.values())
+    finally:
+        tracemalloc.stop()
+    return peaks
+
+#
+# Runs one case and returns { 'time': { stage: { min, median } },
+# 'memory': { stage: peak bytes } }
+#
+def run_case(rules, repeats=3):
+    runs = [ time_stages(rules) for i in range(repeats) ]
+    times = { name: { 'min': min(r[name] for r in runs),
+        'median': statistics.median(r[name] for r in runs) }
+        for name in runs[0] }
+    return { 'time': times, 'memory': memory_stages(rules) }
+
+#
+# Runs the given cases (all of them if None) and returns the JSON-ready
+# report
+#
+def run(cases=None, repeats=3):
+    names = list(CASES) if cases is None else cases
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'platform': platform.platform(),
+            'repeats': repeats,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'cases': {},
+    }
+    for name in names:
+        report['cases'][name] = dict(rules=CASES[name]._asdict(),
+            **run_case(CASES[name], repeats))
+    return report
+
+def save(report, path):
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+#
+# Compares a report against a baseline report. A metric regresses when it
+# grew by more than its threshold (0.1 is 10%); times compare the minimum
+# over the repeats. Times below min_time seconds are too noisy and are
+# left out. Returns a list of (case, metric, stage, baseline, new, ratio,
+# regressed) for every metric in both reports.
+#
+def compare(baseline, report, time_threshold=0.1, memory_threshold=0.1,
+        min_time=0.001):
+    rows = []
+    for case, old in baseline['cases'].items():
+        new = report['cases'].get(case)
+        if new is None:
+            continue
+        for stage, value in old['time'].items():
+            if stage not in new['time'] or value['min'] < min_time:
+                continue
+            a, b = value['min'], new['time'][stage]['min']
+            rows.append((case, 'time', stage, a, b, b / a,
+                b > a * (1 + time_threshold)))
+        for stage, a in old['memory'].items():
+            if stage not in new['memory'] or a == 0:
+                continue
+            b = new['memory'][stage]
+            rows.append((case, 'memory', stage, a, b, b / a,
+                b > a * (1 + memory_threshold)))
+    return rows
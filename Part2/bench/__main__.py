@@ -0,0 +1,75 @@
+#!/usr/bin/python3
+#
+# __main__.py
+#
+# Command line of the benchmark suite (python3 -m bench -h)
+#
+
+import argparse
+import sys
+
+import bench
+
+# print a benchmark report as a table
+def print_report(report):
+    for case, result in report['cases'].items():
+        print("%s:"%case)
+        for stage, t in result['time'].items():
+            print("  %-10s %10.4fs (median %.4fs) %12d bytes"%(stage, t['min'],
+                t['median'], result['memory'].get(stage, 0)))
+
+# print a comparison and return the number of regressions
+def print_compare(rows):
+    regressions = 0
+    for case, metric, stage, a, b, ratio, regressed in rows:
+        regressions += regressed
+        print("%-28s %-6s %-10s %12.4g %12.4g %7.2fx%s"%(case, metric, stage,
+            a, b, ratio, "  REGRESSION" if regressed else ""))
+    return regressions
+
+#
+# Parses command line and runs or compares benchmarks
+#
+def main(argv):
+    parser = argparse.ArgumentParser(prog="python3 -m bench",
+        description="Benchmark the easybj calculator.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help="run the benchmarks")
+    run.add_argument('-o', '--output', help="save the report to this JSON file")
+    run.add_argument('-n', '--repeats', type=int, default=3)
+    run.add_argument('-c', '--case', action='append', choices=list(bench.CASES),
+        help="case to run (repeat for several, default: all)")
+    run.add_argument('-b', '--baseline', help="compare against this report")
+    run.add_argument('--time-threshold', type=float, default=0.1)
+    run.add_argument('--memory-threshold', type=float, default=0.1)
+
+    cmp = commands.add_parser('compare', help="compare two saved reports")
+    cmp.add_argument('baseline')
+    cmp.add_argument('report')
+    cmp.add_argument('--time-threshold', type=float, default=0.1)
+    cmp.add_argument('--memory-threshold', type=float, default=0.1)
+
+    args = parser.parse_args(argv[1:])
+
+    if args.command == 'run':
+        report = bench.run(args.case, args.repeats)
+        print_report(report)
+        if args.output:
+            bench.save(report, args.output)
+        if not args.baseline:
+            return 0
+        baseline = bench.load(args.baseline)
+    else:
+        baseline = bench.load(args.baseline)
+        report = bench.load(args.report)
+
+    rows = bench.compare(baseline, report, args.time_threshold,
+        args.memory_threshold)
+    regressions = print_compare(rows)
+    print("%d regression(s)"%regressions)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,164 @@
+#!/usr/bin/python3
+#
+# counting.py
+#
+# Card counting numbers for the calculated game: the effect of removing
+# each card on the advantage, and the true count at which each play of the
+# strategy table changes
+#
+# Example:
+#   python3 counting.py --eor_decks 6 --counts -10 10
+#
+# Every number comes from a full recompute of the calculator with the card
+# probabilities of the shoe in question (as an infinite deck of that
+# composition). The recomputes run on a process pool and go through
+# easybj.calculate(), so they are cached like any other result (set
+# EASYBJ_CACHE to keep them between runs).
+#
+
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import easybj
+from easybj import DISTINCT, DEALER_CODE, PLAYER_CODE, shoe_counts
+from rules import Rules
+from sweep import RULE_TYPES
+from table import Table
+
+# Hi-Lo tag of each card in DISTINCT (the count goes up as low cards leave)
+HI_LO = (-1, 1, 1, 1, 1, 1, 0, 0, 0, -1)
+
+#
+# Returns the card weights of one deck at a true count
+#
+# true_count: running count per deck left
+# tags: count tag of each card in DISTINCT (a balanced count)
+#
+# The cards seen are taken in proportion to each card's tag and share of
+# the deck, so the count of the cards seen per deck is the true count.
+#
+def true_count_weights(true_count, tags=HI_LO):
+    deck = shoe_counts(1)
+    scale = true_count / sum(n * t * t for n, t in zip(deck, tags))
+    weights = tuple(n * (1 - scale * t) for n, t in zip(deck, tags))
+    if min(weights) < 0:
+        raise ValueError("true count %s is out of range"%true_count)
+    return weights
+
+# return the advantage and strategy rows of one card composition (runs in
+# a worker process)
+def _evaluate(args):
+    rules, prob = args
+    results = easybj.calculate(rules, prob=prob)
+    strategy = results['strategy']
+    return results['advantage'], { p: strategy.row(p) for p in PLAYER_CODE }
+
+#
+# Evaluates a list of card compositions on a process pool and returns
+# (advantage, strategy rows) of each
+#
+# workers: number of worker processes (all cores if None, 1 evaluates in
+#          this process)
+#
+def evaluate(rules, weights, workers=None):
+    tasks = [ (rules, w) for w in weights ]
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        return [ _evaluate(t) for t in tasks ]
+    with ProcessPoolExecutor(workers) as pool:
+        return list(pool.map(_evaluate, tasks,
+            chunksize=max(1, len(tasks) // (workers * 4))))
+
+#
+# Returns the effect of removing one card of each rank from a shoe of the
+# given decks on the advantage, as a dict of card to advantage change
+#
+def effects_of_removal(rules=None, decks=1, workers=None):
+    rules = Rules() if rules is None else rules
+    full = shoe_counts(decks)
+    weights = [ full ] + [ full[:k] + (full[k] - 1,) + full[k+1:]
+        for k in range(len(DISTINCT)) ]
+    results = evaluate(rules, weights, workers)
+    base = results[0][0]
+    return { c: adv - base for c, (adv, rows) in zip(DISTINCT, results[1:]) }
+
+#
+# Returns the strategy deviations over a range of true counts
+#
+# counts: true counts to evaluate (should hold 0)
+# tags: count tag of each card in DISTINCT
+#
+# Returns (index, play, advantage) where index is a Table of the true
+# count closest to 0 at which the play of each cell changes from its play
+# at count 0 (empty if it never does within the counts), play is a Table
+# of the play taken past that index and advantage a dict of true count to
+# advantage.
+#
+def deviation_indices(rules=None, counts=range(-10, 11), tags=HI_LO,
+        workers=None):
+    rules = Rules() if rules is None else rules
+    counts = sorted(set(counts) | { 0 })
+    results = dict(zip(counts, evaluate(rules,
+        [ true_count_weights(t, tags) for t in counts ], workers)))
+    base = results[0][1]
+
+    index = Table(float, DEALER_CODE, PLAYER_CODE)
+    play = Table(str, DEALER_CODE, PLAYER_CODE)
+    # search outward from count 0, positive counts first on a tie
+    order = sorted((t for t in counts if t != 0), key=lambda t: (abs(t), t < 0))
+    for p in PLAYER_CODE:
+        for j, d in enumerate(DEALER_CODE):
+            for t in order:
+                action = results[t][1][p][j]
+                if action != base[p][j]:
+                    index[p,d] = float(t)
+                    play[p,d] = action
+                    break
+    return index, play, { t: r[0] for t, r in results.items() }
+
+#
+# Parses command line and prints the effects of removal and the strategy
+# deviations
+#
+def main(argv):
+    parser = argparse.ArgumentParser(prog=argv[0],
+        description="Card counting effects and strategy indices.")
+    parser.add_argument('--eor_decks', type=int, default=1,
+        help="decks of the shoe cards are removed from (default: 1)")
+    parser.add_argument('--counts', type=int, nargs=2, default=[ -10, 10 ],
+        metavar=('LOW', 'HIGH'), help="range of true counts (default: -10 10)")
+    parser.add_argument('--workers', type=int, default=None,
+        help="worker processes (default: all cores)")
+    for name in Rules._fields:
+        if name != 'decks':
+            parser.add_argument('--' + name, type=RULE_TYPES[name],
+                default=Rules._field_defaults[name])
+    args = parser.parse_args(argv[1:])
+
+    rules = Rules(**{ name: getattr(args, name) for name in Rules._fields
+        if name != 'decks' })
+    effects = effects_of_removal(rules, args.eor_decks, args.workers)
+    print("Effects of Removal (%d deck%s):"%(args.eor_decks,
+        "s" if args.eor_decks > 1 else ""))
+    print(" ".join("%s: %+.4f%%"%(c, e * 100) for c, e in effects.items()))
+
+    index, play, advantage = deviation_indices(rules,
+        range(args.counts[0], args.counts[1] + 1), workers=args.workers)
+    print("Advantage by True Count:")
+    print(" ".join("%+d: %.3f%%"%(t, a * 100) for t, a in advantage.items()))
+    print("Deviation Indices:")
+    width = max(len(p) for p in PLAYER_CODE)
+    print(" ".join([ " " * width ] + [ d.center(6) for d in DEALER_CODE ]))
+    for p in PLAYER_CODE:
+        cells = []
+        for d in DEALER_CODE:
+            t = index[p,d]
+            cells.append("------" if t is None else
+                ("%+d%s"%(t, play[p,d])).center(6))
+        print(" ".join([ p.ljust(width) ] + cells))
+
+
+if __name__ == "__main__":
+    main(sys.argv)
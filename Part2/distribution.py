@@ -0,0 +1,281 @@
+#!/usr/bin/python3
+#
+# distribution.py
+#
+# Distribution of the net units won in a round under the calculated
+# strategy (not just its mean), with the variance, skew and risk of ruin it
+# gives
+#
+# Example:
+#   python3 distribution.py --bankroll 50 100 200 --max_splits 3
+#
+# Every hand is played against a dealer whose final outcome does not depend
+# on the player's cards (an infinite deck), so given the dealer outcome the
+# hands of a split are independent. Each cell therefore holds, for every
+# final dealer outcome, a probability vector over the net units of the
+# hand, and split hands are combined by convolving those vectors. A vector
+# of n net units holds the units -n to n in order.
+#
+
+import argparse
+import math
+import sys
+
+import numpy as np
+
+import easybj
+from easybj import (BUST, EMPTY, NUM_STATES, STATE_NEXT, TRAVERSE_ORDER,
+    DISTINCT, DEALER_CODE, INITIAL_CODE, DEALER_OUTCOMES,
+    PLAYER_CODE_STATE, PLAYER_STATE_CODE, state_total)
+from rules import Rules
+from sweep import RULE_TYPES
+
+# final player totals told apart when settling (16 stands for any total
+# of 16 or less)
+FINAL_TOTALS = [ BUST, 16, 17, 18, 19, 20, 21 ]
+
+# index into FINAL_TOTALS of standing on every state
+FINAL_INDEX = [ 0 if s == BUST else FINAL_TOTALS.index(max(state_total(s), 16))
+    for s in range(NUM_STATES) ]
+
+# sign of the result of each final player total against each final dealer
+# outcome (a busted hand loses even if the dealer busts)
+SETTLE = np.array([ [ -1 if t == BUST else (t > o) - (t < o)
+    for o in DEALER_OUTCOMES ] for t in FINAL_TOTALS ])
+
+# SETTLE as one-hot vectors over the net units of a hand of one and of two
+# bets: SETTLE_UNITS[bet][t, o] is the vector of total t against outcome o
+SETTLE_UNITS = { bet: np.eye(5)[2 + bet * SETTLE] for bet in (1, 2) }
+
+# one-hot final total distribution of standing on every state
+STAND_FINAL = np.eye(len(FINAL_TOTALS))[FINAL_INDEX]
+
+# largest net units kept when splits are unlimited (more need too many
+# splits in one round to show)
+UNLIMITED_UNITS = 128
+
+# return the index of the first of the largest EVs (the choice max() makes)
+def best(*evs):
+    return max(range(len(evs)), key=lambda i: (evs[i], -i))
+
+# add two vectors of net units of any length
+def add(a, b):
+    if a.shape[-1] < b.shape[-1]:
+        a, b = b, a
+    pad = (a.shape[-1] - b.shape[-1]) // 2
+    a = a.copy()
+    a[..., pad:a.shape[-1] - pad] += b
+    return a
+
+# return a vector cut down to at most n net units either way
+def trim(a, n):
+    cut = max(a.shape[-1] // 2 - n, 0)
+    return a[..., cut:a.shape[-1] - cut]
+
+# return the distribution of the sum of two hands from their vectors for
+# each dealer outcome
+def convolve(a, b):
+    return np.array([ np.convolve(x, y) for x, y in zip(a, b) ])
+
+#
+# Distributions of the net units of the calculated strategy
+#
+# rules: game rules of an infinite deck (rules.decks must be None)
+# prob: card probabilities (see easybj.rank_probabilities())
+#
+class DistributionCalculator:
+    def __init__(self, rules=None, prob=None):
+        self.rules = Rules() if rules is None else rules
+        if self.rules.decks is not None:
+            raise ValueError("outcome distributions need an infinite deck")
+        self.results = easybj.calculate(self.rules, prob=prob)
+        self.prob = np.array(easybj.rank_probabilities(prob))
+        self.columns = { d: self.make_column(d) for d in DEALER_CODE }
+
+    #
+    # Returns the hand vectors of one dealer code: a dict of action letter
+    # (S, H, D, and 0 for the best play of a split hand) to a list of the
+    # vectors of each state, each an array (dealer outcome, net unit)
+    #
+    def make_column(self, d):
+        prob = self.prob
+        ev = { a: self.results[name].column(d) for a, name in
+            (('S', 'stand'), ('H', 'hit'), ('D', 'double')) }
+        rows = { a: self.results[name].yindex for a, name in
+            (('S', 'stand'), ('H', 'hit'), ('D', 'double')) }
+
+        def value(a, s):
+            return ev[a][rows[a][PLAYER_STATE_CODE[s]]]
+
+        # final totals of hitting every state and then playing on
+        hit = np.zeros((NUM_STATES, len(FINAL_TOTALS)))
+        after = STAND_FINAL.copy()
+        for s in TRAVERSE_ORDER[1:]:
+            hit[s] = prob @ after[STATE_NEXT[s]]
+            if value('S', s) < value('H', s):
+                after[s] = hit[s]
+        double = np.einsum('k,skt->st', prob, STAND_FINAL[STATE_NEXT])
+
+        units = lambda final, bet: np.einsum('st,tok->sok', final, SETTLE_UNITS[bet])
+        column = { 'S': units(STAND_FINAL, 1), 'H': units(hit, 1),
+            'D': units(double, 2) }
+
+        # best play of a split hand (never a double unless allowed after a
+        # split)
+        actions = 'SHD' if self.rules.double_after_split else 'SH'
+        column[0] = list(column['S'])
+        for s in TRAVERSE_ORDER[1:]:
+            column[0][s] = column[actions[best(*(value(a, s) for a in actions))]][s]
+        return column
+
+    #
+    # Returns the vector of splitting a pair (card index i into DISTINCT)
+    # against dealer code d, with the splits the rules allow
+    #
+    def split_vector(self, i, d):
+        column = self.columns[d]
+        start = STATE_NEXT[EMPTY][i]
+        hands = [ column[0][n] for n in STATE_NEXT[start] ]
+
+        # split aces get one card each unless they can be played out
+        if DISTINCT[i] == 'A':
+            if not self.rules.hit_split_aces:
+                hands = [ column['S'][n] for n in STATE_NEXT[start] ]
+            hand = np.einsum('k,kon->on', self.prob, np.array(hands))
+            return convolve(hand, hand)
+
+        q = self.prob[i]
+        rest = np.einsum('k,kon->on', np.delete(self.prob, i),
+            np.delete(np.array(hands), i, axis=0))
+
+        # with no limit every hand dealt the pair card splits again, so a
+        # split hand is the fixed point of hand = rest + q * (hand + hand)
+        if self.rules.max_splits is None:
+            hand = rest
+            while True:
+                last, hand = hand, trim(add(rest, q * convolve(hand, hand)),
+                    UNLIMITED_UNITS)
+                if np.abs(add(hand, -last)).max() < 1e-17:
+                    return convolve(hand, hand)
+
+        # the resplit recursion of easybj.split_levels() on vectors
+        levels = [ hands[i] ]
+        for n in range(1, self.rules.max_splits + 1):
+            levels.append(add(add(convolve(rest, rest),
+                2 * q * convolve(rest, levels[n-1])),
+                q * q * convolve(levels[n // 2], levels[(n-1) // 2])))
+        return levels[-1]
+
+    #
+    # Returns the distribution of the net units of an initial cell played
+    # by the strategy as (units, probabilities), or None for a cell settled
+    # before any play (a blackjack)
+    #
+    def cell(self, p, d):
+        if p == 'BJ' or d == 'BJ':
+            return None
+        play = self.results['strategy'][p,d][0]
+        if play == 'R':
+            return np.array([ -0.5 ]), np.array([ 1. ])
+        if play == 'P':
+            vector = self.split_vector(DISTINCT.index(p[0]), d)
+        else:
+            vector = self.columns[d][play][PLAYER_CODE_STATE[p]]
+        dealer = self.results['dealer'][d]
+        probs = np.array([ dealer.get(str(o), 0.) for o in DEALER_OUTCOMES ]) @ vector
+        n = len(probs) // 2
+        return np.arange(-n, n + 1, dtype=float), probs
+
+    #
+    # Returns the distribution of the net units of a round as (units,
+    # probabilities), with the units in increasing order
+    #
+    def round(self):
+        initial = self.results['initial']
+        total = {}
+        for p in INITIAL_CODE:
+            for d in DEALER_CODE + [ 'BJ' ]:
+                w = initial[p,d]
+                if w is None or not w:
+                    continue
+                if d == 'BJ':
+                    cell = np.array([ 0. if p == 'BJ' else -1. ]), np.array([ 1. ])
+                elif p == 'BJ':
+                    cell = np.array([ float(self.rules.blackjack_pays) ]), np.array([ 1. ])
+                else:
+                    cell = self.cell(p, d)
+                for u, q in zip(*cell):
+                    if q:
+                        total[u] = total.get(u, 0.) + w * q
+        units = sorted(total)
+        return np.array(units), np.array([ total[u] for u in units ])
+
+#
+# Returns (mean, variance, skew) of a distribution
+#
+def moments(units, probs):
+    mean = probs @ units
+    var = probs @ np.square(units - mean)
+    skew = probs @ np.power(units - mean, 3) / var ** 1.5 if var > 0 else 0.
+    return float(mean), float(var), float(skew)
+
+#
+# Returns the adjustment coefficient of a distribution: the R > 0 with
+# E[exp(-R X)] = 1 (0 if the mean is not positive or nothing is lost)
+#
+def adjustment_coefficient(units, probs, tol=1e-12):
+    mean, var, skew = moments(units, probs)
+    if mean <= 0 or probs[units < 0].sum() == 0:
+        return 0.
+    f = lambda r: np.log(probs @ np.exp(-r * units))
+    low, high = 0., 2 * mean / var
+    while f(high) < 0:
+        low, high = high, 2 * high
+    while high - low > tol * high:
+        mid = (low + high) / 2
+        if f(mid) < 0:
+            low = mid
+        else:
+            high = mid
+    return (low + high) / 2
+
+#
+# Returns the probability of losing a bankroll (in units) playing on
+# forever, estimated as exp(-R * bankroll) with R the adjustment
+# coefficient (an upper bound that is tight for a bankroll of many units)
+#
+def risk_of_ruin(units, probs, bankroll):
+    r = adjustment_coefficient(units, probs)
+    return 1. if r == 0 else math.exp(-r * bankroll)
+
+#
+# Parses command line and prints the distribution of a round with its
+# moments and the risk of ruin of each bankroll
+#
+def main(argv):
+    parser = argparse.ArgumentParser(prog=argv[0],
+        description="Distribution of the net units of a round.")
+    parser.add_argument('--bankroll', type=float, nargs='+',
+        default=[ 50., 100., 200., 500. ], help="bankrolls in units")
+    for name in Rules._fields:
+        if name != 'decks':
+            parser.add_argument('--' + name, type=RULE_TYPES[name],
+                default=Rules._field_defaults[name])
+    args = parser.parse_args(argv[1:])
+
+    rules = Rules(**{ name: getattr(args, name) for name in Rules._fields
+        if name != 'decks' })
+    units, probs = DistributionCalculator(rules).round()
+    print("Distribution of Net Units per Round:")
+    for u, q in zip(units, probs):
+        print("%+6g  %.8f"%(u, q))
+    mean, var, skew = moments(units, probs)
+    print("Mean: %.6f  Variance: %.6f  Std Dev: %.6f  Skew: %.6f"%(
+        mean, var, math.sqrt(var), skew))
+    print("Risk of Ruin:")
+    for b in args.bankroll:
+        print("%8g units: %.6g"%(b, risk_of_ruin(units, probs, b)))
+
+
+if __name__ == "__main__":
+    main(sys.argv)
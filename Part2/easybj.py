@@ -6,8 +6,15 @@
 #
 
 from table import Table
+from rules import Rules
+from functools import lru_cache
+import resultcache
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
 from collections import defaultdict
-import copy
+from collections.abc import Mapping
+import numpy as np
 
 # code names for all the hard hands
 HARD_CODE = [ '4', '5', '6', '7', '8', '9', '10', '11', '12', '13', '14', 
@@ -55,704 +62,623 @@ NUM_FACES = 4
 # number of ranks in a French deck
 NUM_RANKS = 13
 
+# index into DISTINCT of every card letter (faces count as tens)
+CARD_INDEX = dict({ c: k for k, c in enumerate(DISTINCT) },
+    **{ c: DISTINCT.index('T') for c in 'JQK' })
+
 # return the probability of receiving this card
 def probability(card):
     return (1 if card != 'T' else NUM_FACES) / NUM_RANKS
 
 #
-# Represents a Blackjack hand (owned by either player or dealer)
+# Returns the probability of drawing each card in DISTINCT as a tuple
 #
-# Note: you should make BIG changes to this class
+# prob: weight of each card in DISTINCT (eg card counts), scaled to sum
+#       to 1, or None for the probabilities of a full deck
 #
-class Hand:
-    def __init__(self, x, y, dealer=False):
-        self.cards = [x, y]
-        self.is_dealer = dealer
+def rank_probabilities(prob=None):
+    if prob is None:
+        return tuple(probability(c) for c in DISTINCT)
+    if len(prob) != len(DISTINCT):
+        raise ValueError("expected a probability for each of %s"%"".join(DISTINCT))
+    total = float(sum(prob))
+    if total <= 0 or min(prob) < 0:
+        raise ValueError("card probabilities must be positive")
+    return tuple(float(p) / total for p in prob)
 
-        self.soft_aces = 0        
-        self.sum = 0
-        self.code_str = ""
+#
+# Hand state graph
+#
+# Every hand is reduced to an integer state so the table builders can walk
+# precomputed successors instead of building and copying Hand objects.
+# State 0 is BUST, state 1 is the empty hand, states 2 to 21 are the hard
+# totals and states 22 to 31 are the soft totals 11 to 20. A soft 21 is
+# folded into hard 21 since neither player nor dealer ever draws to it.
+#
+EMPTY = 1
+
+# soft total t is stored as state t + SOFT_BASE
+SOFT_BASE = 11
+
+NUM_STATES = 32
+
+# point value of each card in DISTINCT (aces counted as one)
+CARD_VALUE = [ 1, 2, 3, 4, 5, 6, 7, 8, 9, 10 ]
+
+# return the state for the given total
+def make_state(total, soft=False):
+    if total > 21:
+        return BUST
+    if soft and total < 21:
+        return total + SOFT_BASE
+    return total
+
+# return the total of a state
+def state_total(state):
+    return state - SOFT_BASE if state > 21 else state
+
+# return whether a state is a soft total
+def state_is_soft(state):
+    return state > 21
+
+# return the state reached by drawing a card with the given point value
+def _draw(state, value):
+    if state == BUST:
+        return BUST
+    total = 0 if state == EMPTY else state_total(state)
+    soft = state_is_soft(state)
+    if value == 1 and not soft and total + 11 <= 21:
+        return make_state(total + 11, True)
+    total += value
+    if soft and total > 21:
+        return make_state(total - 10)
+    return make_state(total, soft)
+
+# successor of every state for each card in DISTINCT
+STATE_NEXT = [ [ _draw(s, v) for v in CARD_VALUE ] for s in range(NUM_STATES) ]
+
+# return the state of a hand holding the given cards
+def hand_state(cards):
+    state = EMPTY
+    for c in cards:
+        state = STATE_NEXT[state][DISTINCT.index(c)]
+    return state
+
+# return the table code of a state, or None if no table has a row for it
+def _state_code(state, dealer):
+    total = state_total(state)
+    if state == BUST:
+        return str(BUST)
+    if not state_is_soft(state):
+        return str(total) if total >= 4 else None
+    if total == 11:
+        return None
+    if total == 12:
+        return 'AA'
+    # dealer stands on all soft 18 and above, which are shown as hard
+    if dealer and total >= 18:
+        return str(total)
+    return 'A' + str(total - 11)
+
+# table code of every state as seen by the player and by the dealer
+PLAYER_STATE_CODE = [ _state_code(s, False) for s in range(NUM_STATES) ]
+DEALER_STATE_CODE = [ _state_code(s, True) for s in range(NUM_STATES) ]
+
+# state of every player and dealer code
+PLAYER_CODE_STATE = { c: s for s, c in enumerate(PLAYER_STATE_CODE) if c }
+DEALER_CODE_STATE = { c: s for s, c in enumerate(DEALER_STATE_CODE)
+    if c and not (c.isdigit() and state_is_soft(s)) }
+PLAYER_CODE_STATE.update({ c: hand_state(c) for c in SPLIT_CODE })
+
+# states that can draw to states after them (bottom up order): hard 21 to 11,
+# then soft 20 to 12, then hard 10 to 4
+TRAVERSE_ORDER = list(range(21, 10, -1)) + \
+    [ make_state(t, True) for t in range(20, 11, -1) ] + list(range(10, 3, -1))
+
+# one-hot successor matrix: NEXT_MATRIX[s, k, n] is 1 if state s moves to
+# state n when drawing card DISTINCT[k]
+NEXT_MATRIX = np.zeros((NUM_STATES, len(DISTINCT), NUM_STATES))
+for _s, _row in enumerate(STATE_NEXT):
+    NEXT_MATRIX[_s, range(len(DISTINCT)), _row] = 1.
 
-        self._calculate_sum()
-        self._calculate_code()
+#
+# Dealer engine
+#
+# The dealer's play is an absorbing Markov chain over the hand states: a
+# state where the dealer stands (or busts) is absorbing, every other state
+# draws. The final outcome distribution of every state is found with one
+# linear solve instead of walking the states one by one.
+#
 
-    
-    # Return whether hand is eligable to split
-    def can_split(self):
-        tens = "TJQK"
+# final dealer outcomes, in the column order of dealer_outcomes()
+DEALER_OUTCOMES = [ BUST, 17, 18, 19, 20, 21 ]
 
-        if (len(self.cards) == 2):
-            if (self.cards[0] == self.cards[1] or (self.cards[0] in tens and self.cards[1] in tens)):
-                return True
-        return False
+# return whether the dealer stands on a state
+def dealer_stands(state, hit_soft17=True):
+    total = state_total(state)
+    return state == BUST or (total >= 17 and
+        not (hit_soft17 and total == 17 and state_is_soft(state)))
 
-    # Return whether hand is BJ
-    def _is_blackjack(self):
-        return (len(self.cards) == 2 and self.sum == 21)
+# return whether the dealer stands on each state
+def dealer_stand_list(hit_soft17=True):
+    return [ dealer_stands(s, hit_soft17) for s in range(NUM_STATES) ]
 
-    # Return whether hand is busted
-    def _is_bust(self):
-        return self.sum > 21
+# sign of the result of standing on each STAND_CODE total against each
+# final dealer outcome (a dealer bust counts as 0, below any total)
+STAND_SIGN = np.sign(np.array([ state_total(PLAYER_CODE_STATE[p])
+    for p in STAND_CODE ])[:, None] - np.array(DEALER_OUTCOMES)[None, :])
 
-    # calculates and saves value of hand, softaces as attributes
-    def _calculate_sum(self):
-        tens = "TJQK"
+# final outcome distribution of a dealer standing on each state
+DEALER_FINAL = [ [ float(t == state_total(s)) for t in DEALER_OUTCOMES ]
+    for s in range(NUM_STATES) ]
 
-        for card in self.cards:
+#
+# Returns the probability of every final dealer outcome from every state
+#
+# prob: probability of drawing each card in DISTINCT, or any stack of such
+#       vectors with shape (..., len(DISTINCT))
+#
+# hit_soft17: dealer hits soft 17
+#
+# The result has shape (..., NUM_STATES, len(DEALER_OUTCOMES)).
+#
+def dealer_outcomes(prob, hit_soft17=True):
+    prob = np.asarray(prob, dtype=np.float64)
+    stands = dealer_stand_list(hit_soft17)
+    stand = [ s for s in range(NUM_STATES) if stands[s] ]
+    draw = [ s for s in range(NUM_STATES) if not stands[s] ]
+
+    # outcome of every absorbing state
+    absorbed = np.zeros((len(stand), len(DEALER_OUTCOMES)))
+    for i, s in enumerate(stand):
+        absorbed[i, DEALER_OUTCOMES.index(state_total(s))] = 1.
+
+    # transitions out of the drawing states
+    moves = np.einsum('...k,skn->...sn', prob, NEXT_MATRIX[draw])
+    to_draw = moves[..., draw]
+    to_stand = moves[..., stand] @ absorbed
+
+    # solve (I - Q) X = R for the drawing states
+    result = np.zeros(prob.shape[:-1] + (NUM_STATES, len(DEALER_OUTCOMES)))
+    result[..., stand, :] = absorbed
+    result[..., draw, :] = np.linalg.solve(np.eye(len(draw)) - to_draw, to_stand)
+    return result
 
-            if (card == 'A'):
-                if (self.sum + 11 > 21):
-                    self.sum += 1
-                else:
-                    self.sum += 11
-                    self.soft_aces += 1
+#
+# Resplit solver
+#
+# A split hand dealt the pair card again is resplit while splits are left.
+# When both hands of a split pair again, the splits left are shared
+# between them (the first hand takes the odd one); when only one does, it
+# takes them all. The EV of splitting with n splits left then only needs
+# the EVs with fewer splits left, so every limit up to n costs O(n).
+#
 
-            elif (card in tens):
-                self.sum += 10
+# resplit levels listed in the results when splits are unlimited
+RESPLIT_SHOWN = 3
 
-            else:
-                self.sum += int(card)
+#
+# Returns the EV of splitting a pair for each number of splits allowed,
+# as a list where item n is the EV with n splits allowed (item 0 is the EV
+# of the hand holding the pair played without splitting)
+#
+# q: probability of drawing the pair card
+# pair_ev: EV of a split hand that draws the pair card and cannot split
+# rest: EV of a split hand that does not draw the pair card, times the
+#       probability of not drawing it
+# splits: largest number of splits allowed
+#
+# Any argument may be an array (eg one item per dealer code).
+#
+def split_levels(q, pair_ev, rest, splits):
+    levels = [ pair_ev ]
+    for n in range(1, splits + 1):
+        levels.append(2 * rest + 2 * q * (1 - q) * levels[n-1] +
+            q * q * (levels[n // 2] + levels[(n-1) // 2]))
+    return levels
+
+# return the EV of splitting a pair with no limit on the splits (the fixed
+# point of split_levels()). There is none when the pair card is drawn half
+# the time or more: the hands split expected are then unbounded.
+def split_unlimited(q, rest):
+    if np.any(np.asarray(q) >= 0.5):
+        raise ValueError("unlimited splits need a pair card probability below 1/2")
+    return 2 * rest / (1 - 2 * q)
+
+#
+# Represents a Blackjack hand (owned by either player or dealer)
+#
+# A hand is immutable and only holds what decides its play: its state
+# (total and soft flag), number of cards, the rank of a two card pair and
+# whether it is the dealer's. Hands are interned on those fields, so
+# Hand(x, y) and add_card() return a shared instance and only the first
+# hand of each kind is constructed. As in the state graph a hand of 21 is
+# done: a card drawn to it busts it.
+#
+class Hand:
+    __slots__ = ('state', 'total', 'soft', 'ncards', 'pair', 'dealer', 'code_str')
+
+    # number of hands constructed (read by the calculator instrumentation)
+    constructed = 0
+
+    # interned hands by (state, cards, pair rank, dealer)
+    _interned = {}
+
+    # interned two card hands by (card, card, dealer)
+    _dealt = {}
+
+    def __new__(cls, x, y, dealer=False):
+        hand = cls._dealt.get((x, y, dealer))
+        if hand is None:
+            hand = cls.empty(dealer).add_card(x).add_card(y)
+            cls._dealt[x, y, dealer] = hand
+        return hand
+
+    def __setattr__(self, name, value):
+        raise AttributeError("a Hand cannot be changed")
+
+    # return the interned hand of the given fields
+    @classmethod
+    def _intern(cls, state, ncards, pair, dealer):
+        key = (state, ncards, pair, dealer)
+        hand = cls._interned.get(key)
+        if hand is None:
+            Hand.constructed += 1
+            hand = object.__new__(cls)
+            fields = { 'state': state, 'total': state_total(state),
+                'soft': state_is_soft(state), 'ncards': ncards, 'pair': pair,
+                'dealer': dealer }
+            for name, value in fields.items():
+                object.__setattr__(hand, name, value)
+            object.__setattr__(hand, 'code_str', hand._calculate_code())
+            cls._interned[key] = hand
+        return hand
+
+    # return the hand holding no cards
+    @classmethod
+    def empty(cls, dealer=False):
+        return cls._intern(EMPTY, 0, None, dealer)
 
+    # Return whether hand is eligable to split
+    def can_split(self):
+        return self.pair is not None
 
-            if (self.sum > 21 and self.soft_aces > 0):
-                self.soft_aces -= 1
-                self.sum -= 10
-            # print (card, self.sum, self.soft_aces)
+    # Return whether hand is BJ
+    def _is_blackjack(self):
+        return self.ncards == 2 and self.total == 21
 
+    # Return whether hand is busted
+    def _is_bust(self):
+        return self.state == BUST
 
-    # calculates and saves the hand code as an attribute
+    # calculates the hand code
     def _calculate_code(self):
         # Hierarchy: BlackJack/Bust > Split > Soft > Hard
 
         if (self._is_blackjack()):
-            self.code_str = "BJ"
-
-        elif (self._is_bust()): 
-            self.code_str = "0"
+            return "BJ"
 
-        elif (self.can_split() and not self.is_dealer):
-            tens = "TJQK"
-            if (self.cards[0] in tens):
-                self.code_str = "TT"
-            elif (self.soft_aces > 0):
-                self.code_str = "AA"
-            else:
-                self.code_str = str(self.cards[0]) + str(self.cards[1])
-
-        elif (self.soft_aces > 0 and self.sum < 21):            
-            self.code_str = "A" + str(self.sum - 11)
-
-            if (self.is_dealer and self.sum >= 18):     # Dealer treats all soft >= 18 as hard
-                self.code_str = str(self.sum)
-            elif(self.is_dealer and self.can_split()):
-                self.code_str = "AA"
-
-
-        elif (self.sum <= 21):
-            self.code_str = str(self.sum)
-
-        else:
-            # print (self.cards, self.sum, self.soft_aces, self.code_str, self.is_dealer)
-            raise ValueError("unknown card combination code")
-
-    def add_card(self,card):
-        assert(type(card) is str)
-        self.cards.append(card)
-        tens = "TJQK"
-        if (card == 'A'):
-            if (self.sum + 11 > 21):
-                self.sum += 1
-            else:
-                self.sum += 11
-                self.soft_aces += 1
-
-        elif (card in tens):
-            self.sum += 10
-
-        else:
-            self.sum += int(card)
+        elif (self._is_bust()):
+            return "0"
 
+        elif (self.can_split() and not self.dealer):
+            return DISTINCT[self.pair] * 2
 
-        if (self.sum > 21 and self.soft_aces > 0):
-            self.soft_aces -= 1
-            self.sum -= 10
-        # print (card, self.sum, self.soft_aces)
+        elif (self.soft and self.total < 21):
+            # Dealer treats all soft >= 18 as hard
+            if (self.dealer and self.total >= 18):
+                return str(self.total)
+            elif (self.dealer and self.can_split()):
+                return "AA"
+            return "A" + str(self.total - 11)
 
-        self._calculate_code()        
+        return str(self.total)
 
+    # return the hand after drawing a card (a letter of DISTINCT or a face)
+    def add_card(self, card):
+        k = CARD_INDEX[card]
+        state = STATE_NEXT[self.state][k]
+        # a second card of the rank of the first makes a pair
+        pair = k if self.ncards == 1 and self.state == STATE_NEXT[EMPTY][k] else None
+        return Hand._intern(state, self.ncards + 1, pair, self.dealer)
 
-    # probability of receiving this hand
-    def probability(self):
-        p = 1.
-        for c in self.cards:
-            p *= probability(c)
-        return p
-  
     # the code which represents this hand
     def code(self, nosplit=False):
-        # print (self.cards, self.sum, self.soft_aces, self.code_str, self.is_dealer)
         return self.code_str
-                
+
+#
+# Returns (cells, reached): the flat index into the initial probability
+# table of every initial deal (the dealer's two cards and the player's two
+# cards, in DISTINCT order with the last card changing fastest) and a mask
+# of the cells some deal lands in. Neither depends on the card
+# probabilities, so they are worked out once.
+#
+@lru_cache(maxsize=None)
+def initial_cells():
+    table = Table(float, DEALER_CODE + ['BJ'], INITIAL_CODE)
+    width = len(table.xlabels)
+    dealers = [ Hand(i, j, dealer=True).code() for i in DISTINCT for j in DISTINCT ]
+    players = [ table.yindex[Hand(x, y).code()] * width
+        for x in DISTINCT for y in DISTINCT ]
+    cells = np.array([ p + table.xindex[d] for d in dealers for p in players ])
+    reached = np.bincount(cells, minlength=table.table.size).reshape(
+        table.table.shape) > 0
+    cells.setflags(write=False)
+    reached.setflags(write=False)
+    return cells, reached
+
 #
 # Singleton class to store all the results. 
 #
 # Note: you should make HUGE changes to this class
 #
 class Calculator:
-    def __init__(self): 
+    def __init__(self, rules=None, instrument=False, prob=None, columns=None):
+        self.rules = Rules() if rules is None else rules
+        if self.rules.max_splits is not None and self.rules.max_splits < 1:
+            raise ValueError("max_splits must be at least 1 (or None)")
+        # dealer codes whose columns the per column stages fill (the other
+        # columns are left empty)
+        self.columns = DEALER_CODE if columns is None else \
+            [ d for d in DEALER_CODE if d in columns ]
+        if columns is not None and len(self.columns) != len(set(columns)):
+            raise ValueError("unknown dealer codes in %s"%str(columns))
+        # probability of drawing each card in DISTINCT
+        self.prob = rank_probabilities(prob)
+        # EV of giving up the hand (never taken if surrender is not allowed)
+        self.surrender_ev = -0.5 if self.rules.surrender else -np.inf
         self.initprob = Table(float, DEALER_CODE + ['BJ'], INITIAL_CODE, unit='%')
         self.dealprob = defaultdict(dict)
         self.stand_ev = Table(float, DEALER_CODE, STAND_CODE)
         self.hit_ev = Table(float, DEALER_CODE, NON_SPLIT_CODE)
         self.double_ev = Table(float, DEALER_CODE, NON_SPLIT_CODE)
+        # split EV with the splits allowed by the rules
         self.split_ev3 = Table(float, DEALER_CODE, SPLIT_CODE)
-        self.split_ev2 = Table(float, DEALER_CODE, SPLIT_CODE[:-1])
-        self.split_ev1 = Table(float, DEALER_CODE, SPLIT_CODE[:-1])
         self.split_ev0 = Table(float, DEALER_CODE, STAND_CODE)
+        # split_ev0, then the split EV with each lower limit on the splits
+        # (aces are never resplit so they have no row)
+        shown = self.rules.max_splits - 1 if self.rules.max_splits else RESPLIT_SHOWN
+        self.resplit = [ self.split_ev0 ] + [ Table(float, DEALER_CODE,
+            SPLIT_CODE[:-1]) for i in range(shown) ]
         self.optimal_ev = Table(float, DEALER_CODE, PLAYER_CODE)
         self.strategy = Table(str, DEALER_CODE, PLAYER_CODE)
         self.advantage = 0.
+        # stages already run
+        self.done = set()
+        # time and counters of each stage run (None if not instrumented)
+        self.stats = { 'stages': {} } if instrument else None
     
-    # make each cell of the initial probability table      
-    def make_initial_cell(self, player, dealer):
-        table = self.initprob
-        dc = dealer.code()  
-        pc = player.code()
-        prob = dealer.probability() * player.probability()
-        if table[pc,dc] is None:
-            table[pc,dc] = prob
-        else:
-            table[pc,dc] += prob
-    
-    # make the initial probability table            
-    def make_initial_table(self, fill_func):
-        #
-        # TODO: refactor so that other table building functions can use it
-        #
-        for i in DISTINCT:
-            for j in DISTINCT:
-                for x in DISTINCT:
-                    for y in DISTINCT:
-                        dealer = Hand(i, j, dealer=True)
-                        player = Hand(x, y)
-                        fill_func(player, dealer)
-    
-    # verify sum of initial table is close to 1    
-    def verify_initial_table(self):
-        total = 0.
-        for x in self.initprob.xlabels:
-            for y in self.initprob.ylabels:
-                total += self.initprob[y,x]
-        assert(isclose(total))
-
-
-    # make each cell of stand EV table
-    def make_stand_cell(self, player, dealer):
-        table = self.stand_ev
-        dealprob = self.dealprob
-        dc = dealer.code()  
-        pc = player.code()
-
-        if pc == "BJ":
-            pc = "21"
-
-        if player.can_split() and pc != "AA":
-            pc = str(player.sum)
-
-        if dc == "BJ":
+    #
+    # Returns a new calculator for other card probabilities that has run the
+    # same stages as this one, which is left as it is (its tables may be
+    # shared through calculate()). The same calculator is returned if the
+    # probabilities have not changed.
+    #
+    # prob: card weights or probabilities for DISTINCT (see
+    #       rank_probabilities())
+    #
+    # This is a plain recompute of every stage run, the same as building a
+    # Calculator for prob: the hit, double and split EVs of every cell draw
+    # on every card probability, so nothing of this calculator is reused.
+    # No stage walks the initial deals, so it takes a few tens of
+    # milliseconds.
+    #
+    def recalculate(self, prob):
+        if rank_probabilities(prob) == self.prob:
+            return self
+        calc = Calculator(self.rules, self.stats is not None, prob, self.columns)
+        for stage in STAGES:
+            if stage in self.done:
+                calc.run(stage)
+        return calc
+
+    # mark stages run whose tables were filled from elsewhere (eg by the
+    # workers of make_parallel_calculator())
+    def mark_done(self, stages):
+        self.done.update(stages)
+
+    # run a stage (see STAGES) once, after the stages it needs
+    def run(self, stage):
+        if stage in self.done:
             return
+        needs, method = STAGES[stage]
+        for s in needs:
+            self.run(s)
 
-        EV = 0.0
-
-        for outcome in dealprob[dc]:
-            # Dealer wins case
-            if int(outcome) > player.sum:
-                EV -= dealprob[dc][outcome] * 1
-
-            # Player wins case
-            elif int(outcome) < player.sum:
-                EV += dealprob[dc][outcome] * 1
-
-        if table[pc,dc] is None:
-            table[pc,dc] = EV
+        if self.stats is None:
+            getattr(self, method)()
+        else:
+            before = self.counters()
+            start = time.perf_counter()
+            getattr(self, method)()
+            elapsed = time.perf_counter() - start
+            after = self.counters()
+            record = { 'time': elapsed }
+            for name in after:
+                record[name] = after[name] - before[name]
+            self.stats['stages'][stage] = record
+        self.done.add(stage)
+
+    # running counts of the operations the instrumentation reports
+    def counters(self):
+        return {
+            'hand_constructions': Hand.constructed,
+            'table_reads': Table.reads,
+            'table_writes': Table.writes,
+        }
+
+    #
+    # Makes the initial probability table and checks that it sums to 1
+    #
+    # Every cell is the sum of the probabilities of the deals landing in it
+    # (see initial_cells()), taken in deal order.
+    #
+    def make_initial(self):
+        cells, reached = initial_cells()
+        table = np.bincount(cells, self.deal_weights(), self.initprob.table.size)
+        self.initprob.fill(np.where(reached, table.reshape(reached.shape), np.nan))
+        self.verify_initial_table()
+
+    # probability of every initial deal, in the order of initial_cells()
+    def deal_weights(self):
+        prob = np.array(self.prob)
+        outer = np.multiply.outer
+        return outer(outer(outer(prob, prob), prob), prob).ravel()
 
+    # verify sum of initial table is close to 1    
+    def verify_initial_table(self):
+        assert(isclose(float(self.initprob.table.sum())))
+
+
+    #
+    # Makes the stand EV table: the dealer outcome distribution of each
+    # column against STAND_SIGN
+    #
+    def make_stand_table(self):
+        columns = [ DEALER_CODE.index(d) for d in self.columns ]
+        dist = self.dealer_dist[[ DEALER_CODE_STATE[d] for d in self.columns ]]
+        ev = np.full((len(STAND_CODE), len(DEALER_CODE)), np.nan)
+        ev[:, columns] = 0.
+        for k in range(len(DEALER_OUTCOMES)):
+            ev[:, columns] += STAND_SIGN[:, k, None] * dist[None, :, k]
+        self.stand_ev.fill(ev)
+
+    # read one dealer column of a player table into a list indexed by state
+    def state_column(self, table, d):
+        column = [ None ] * NUM_STATES
+        for p, ev in zip(table.ylabels, table.column(d).tolist()):
+            column[PLAYER_CODE_STATE[p]] = ev
+        return column
 
     # make double EV table
     def make_double_table(self):
         table = self.double_ev
+        prob = self.prob
 
-         # Traverse hands in bottom up order
-        traverse_order_p = HARD_CODE[:5:-1] + SOFT_CODE[::-1] + HARD_CODE[5::-1]
-        traverse_order_d = HARD_CODE[:2:-1] + SOFT_CODE[5::-1] + HARD_CODE[2::-1]
-
-        for p in traverse_order_p:
-            
-            p_hand = None
-
-            # Initialize hand to the given cards (eg A6) or arbitrary cards that sum up to given sum (eg 20)
+        for d in self.columns:
+            stand = self.state_column(self.stand_ev, d)
 
-            if p[0] == "A":
-                p_hand = Hand(p[0], p[1])
-            elif p == "20":
-                p_hand = Hand("T","T")
-            else:
-                p_hand = Hand(str(int((int(p)/2))),str(int(int(p)/2) + (int(p) %2 != 0)))
-
-            for d in traverse_order_d:
-
-                if table[p,d] is None:
-                    table[p,d] = 0.0
-
-                for k in range(1,14,1):
-                    
-                    d_hand = None
-
-                    if d[0] == "A":
-                        d_hand = Hand(d[0], d[1], dealer=True)
-                    elif d == "20":
-                        d_hand = Hand("T","T", dealer=True)
-                    else:
-                        d_hand = Hand(str(int((int(d)/2))),str(int(int(d)/2) + (int(d) %2 != 0)), dealer=True)
-
-                    lookup = copy.deepcopy(p_hand)
-
-                    # Initialize lookup hand based on possible cards drawn
-                    if k == 1:
-                        lookup.add_card("A")
-                    elif k < 10:
-                        lookup.add_card(str(k))
-                    else:
-                        lookup.add_card("T")
-
-                    l_c = lookup.code()
-
-                    # Add probabilities to probability table
-                    if lookup.sum > 21: # Double into bust
-                        table[p,d] -= 2 * 1/13.0
-                    else:
-                        table[p,d] += self.stand_ev[l_c,d]*2 * 1/13.0
+            for p in table.ylabels:
+                EV = 0.0
+                for k, n in enumerate(STATE_NEXT[PLAYER_CODE_STATE[p]]):
+                    # double into bust loses both bets
+                    EV += prob[k] * (-2 if n == BUST else 2 * stand[n])
+                table[p,d] = EV
 
 
     # Calculate the dealer table probabilities
     def make_dealer_table(self):
-
-        def get_row_sum(row):
-            sum = 0
-            for key in row:
-                sum += row[key]
-            return sum
-
-        def add_row_probabilities(row1, row2, factor):
-            for key in row2:
-                row1[key] += row2[key]*factor
-
-
         table = self.dealprob
+        prob = self.prob
 
-        for i in DEALER_CODE:
-            table[i] = defaultdict(float)
-
-
-        # First calculate probabilities for when dealer stands
-        for i in range(21,16,-1):
-            table[str(i)] = {str(i): 1}
-
-        # Traverse hands in bottom up order
-        traverse_order = HARD_CODE[-5:2:-1] + SOFT_CODE[5::-1] + HARD_CODE[2::-1]
-
-        for i in traverse_order:
-            for k in range(1,14,1):
-                hand = None
-
-                # Initialize hand to the given cards (eg A6) or arbitrary cards that sum up to given sum (eg 20)
-                if i[0] == "A":
-                    hand = Hand(i[0], i[1], dealer=True)
-                elif i == "20":
-                    hand = Hand("T","T",dealer=True)
-                else:
-                    hand = Hand(str(int((int(i)/2))),str(int(int(i)/2) + (int(i) %2 != 0)), dealer=True) 
-                lookup = copy.deepcopy(hand)
-
-                # Initialize lookup hand based on possible cards drawn
-                if k == 1:
-                    lookup.add_card("A")
-                elif k < 10:
-                    lookup.add_card(str(k))
-                else:
-                    lookup.add_card("T")
-
-                h_c, l_c = (hand.code(), lookup.code())
-
-                # Add probabilities to probability table
-                if l_c == "BJ":
-                    table[h_c]["21"] += 1/13.0
-                if l_c == "0":
-                    table[h_c]["0"] += 1/13.0
-                else:
-                    add_row_probabilities(table[h_c], table[l_c], 1/13.0)
-
+        # final outcome distribution of every dealer state
+        self.dealer_dist = dealer_outcomes(prob, self.rules.hit_soft17)
 
-        for i in table:
-            assert isclose(get_row_sum(table[i]))
+        # dict view of each dealer code keyed by final total
+        for d in self.columns:
+            row = self.dealer_dist[DEALER_CODE_STATE[d]]
+            table[d] = { str(t): float(q) for t, q in zip(DEALER_OUTCOMES, row)
+                if q > 0 }
+            assert isclose(float(row.sum()))
 
 
     # Make Hit EV table
     def make_hit_table(self):
         table = self.hit_ev
-
-        # Traverse hands in bottom up order
-        traverse_order_p = HARD_CODE[:5:-1] + SOFT_CODE[::-1] + HARD_CODE[5::-1]
-        traverse_order_d = HARD_CODE[:2:-1] + SOFT_CODE[5::-1] + HARD_CODE[2::-1]
-
-        for p in traverse_order_p:
-            
-            p_hand = None
-
-            # Initialize hand to the given cards (eg A6) or arbitrary cards that sum up to given sum (eg 20)
-            if p[0] == "A":
-                p_hand = Hand(p[0], p[1])
-            elif p == "20":
-                p_hand = Hand("T","T")
-            else:
-                p_hand = Hand(str(int((int(p)/2))),str(int(int(p)/2) + (int(p) %2 != 0))) 
-
-            for d in traverse_order_d:
-
-                if table[p,d] is None:
-                    table[p,d] = 0.0
-
-                # iterate through possible draws
-                for k in range(1,14,1):
-                    
-                    d_hand = None
-
-                    if d[0] == "A":
-                        d_hand = Hand(d[0], d[1], dealer=True)
-                    elif d == "20":
-                        d_hand = Hand("T","T", dealer=True)
-                    else:
-                        d_hand = Hand(str(int((int(d)/2))),str(int(int(d)/2) + (int(d) %2 != 0)), dealer=True)
-
-                    lookup = copy.deepcopy(p_hand)
-
-                    # Initialize lookup hand based on possible cards drawn
-                    if k == 1:
-                        lookup.add_card("A")
-                    elif k < 10:
-                        lookup.add_card(str(k))
-                    else:
-                        lookup.add_card("T")
-
-                    l_c = lookup.code()
-
-
-                    # Add probabilities to probability table
-                    if lookup.sum > 21: # bust
-                        table[p,d] -= 1/13.0
-                    elif lookup.sum == 21:
-                        table[p,d] += self.stand_ev[l_c,d] * 1/13.0
+        prob = self.prob
+
+        for d in self.columns:
+            stand = self.state_column(self.stand_ev, d)
+            hit = [ None ] * NUM_STATES
+
+            # Traverse hands in bottom up order
+            for s in TRAVERSE_ORDER[1:]:
+                EV = 0.0
+                for k, n in enumerate(STATE_NEXT[s]):
+                    if n == BUST:
+                        EV -= prob[k]
+                    elif n == 21:
+                        EV += prob[k] * stand[n]
                     else:
-                        table[p,d] += max(self.stand_ev[l_c,d], table[l_c,d])* 1/13.0
-                  
+                        EV += prob[k] * max(stand[n], hit[n])
+                hit[s] = EV
+                table[PLAYER_STATE_CODE[s],d] = EV
 
-    def make_split_table(self):
+    # make split_ev0, the best EV of a hand that can no longer split
+    def make_split_ev0(self):
         table0 = self.split_ev0
-        table1 = self.split_ev1
-        table2 = self.split_ev2
-        table3 = self.split_ev3
-
-        traverse_order_p = SPLIT_CODE[::-1]
-        traverse_order_d = HARD_CODE[:2:-1] + SOFT_CODE[5::-1] + HARD_CODE[2::-1]
-
-        # make split_ev0 (base case)
         for p in STAND_CODE:
-            for d in traverse_order_d:
+            for d in self.columns:
+                # a cell no deal reaches stays empty
+                if self.stand_ev[p, d] is None:
+                    continue
                 if p == '21':
                     table0[p, d] = self.stand_ev[p, d]
-                else:
+                elif self.rules.double_after_split:
                     table0[p, d] = max(self.stand_ev[p, d], self.hit_ev[p, d], \
                              self.double_ev[p, d])
-
-        # make split_ev1 where can split one more time
-        for p in traverse_order_p:
-            if p == 'AA':
-                continue
-            p_hand = Hand(p[0], p[1])
-            for d in traverse_order_d:
-                EV_split0 = 0.0
-                if p_hand.can_split():
-                    for k in range(1,14,1):
-                        if k == 1:
-                            new_hand0 = Hand(p[0], "A")
-                        elif k < 10:
-                            new_hand0 = Hand(p[0], str(k))
-                        else:
-                            new_hand0 = Hand(p[0], "T")
-
-                        nh0_c = new_hand0.code()
-                        # At the 3rd split, cannot split into over 20
-                        if new_hand0.can_split():
-                            nh0_c = split2hard(nh0_c)
-                        if nh0_c is 'BJ':
-                            nh0_c = '21'
-                        #EV_split0 += max(self.stand_ev[nh0_c, d], self.hit_ev[nh0_c, d], \
-                                        #self.double_ev[nh0_c, d]) * 1/13.0
-                        EV_split0 += table0[nh0_c, d] * 1/13.0
-                    '''
-                    table1[p, d] = max(self.stand_ev[split2hard(p), d], self.hit_ev[split2hard(p), d], \
-                                    self.double_ev[split2hard(p), d], 2 * EV_split0)
-                    '''
-                    table1[p, d] = 2 * EV_split0
-                '''
                 else:
-                    table1[p, d] = max(self.stand_ev[p, d], self.hit_ev[p, d], \
-                                    self.double_ev[p, d])
-                '''
+                    table0[p, d] = max(self.stand_ev[p, d], self.hit_ev[p, d])
+
+    #
+    # Returns the EVs of a pair split under the rules as (levels, EV) where
+    # levels lists the EV with each lower limit on the splits (for the
+    # resplit tables) and EV is the EV with the splits allowed
+    #
+    # Arguments as for split_levels()
+    #
+    def split_evs(self, q, pair_ev, rest):
+        limit = self.rules.max_splits
+        shown = len(self.resplit) - 1
+        levels = split_levels(q, pair_ev, rest, max(limit or 0, shown))
+        EV = levels[limit] if limit else split_unlimited(q, rest)
+        return levels[1:shown + 1], EV
 
-        # make split_ev2
-        for p in traverse_order_p:
-            if p == 'AA':
-                continue
-            p_hand = Hand(p[0], p[1])
-            for d in traverse_order_d:
-                EV_split0 = 0.0 #new hand that re split
-                EV_split1 = 0.0 #new hand dose not resplit
-                if p_hand.can_split():
-                    for k in range(1, 14, 1):
-                        if k == 1:
-                            new_hand0 = Hand(p[0], "A")
-                        elif k < 10:
-                            new_hand0 = Hand(p[0], str(k))
-                        else:
-                            new_hand0 = Hand(p[0], "T")
-
-                        nh0_c = new_hand0.code()
-
-                        for l in range(1, 14, 1):
-                            if l == 1:
-                                new_hand1 = Hand(p[1], "A")
-                            elif l < 10:
-                                new_hand1 = Hand(p[1], str(l))
-                            else:
-                                new_hand1 = Hand(p[1], "T")
-
-                            nh1_c = new_hand1.code()
-
-                            if new_hand0.can_split() and new_hand1.can_split():
-                                EV_split0 += table1[nh0_c, d] * 1/13.0**2
-                                EV_split1 += table0[split2hard(nh1_c), d] * 1/13.0**2
-                                continue
-
-                            if nh0_c is 'BJ':
-                                EV_split0 += self.stand_ev['21', d] * 1/13.0**2
-                            # EV_split0 += self.stand_ev['21', d]
-                            elif new_hand0.can_split():
-                                #EV_split0 +=  max(table0[split2hard(nh0_c), d], table1[nh0_c, d]) * 1/13.0
-                                EV_split0 +=  table1[nh0_c, d] * 1/13.0**2
-                            # EV_split0 += max(self.stand_ev[split2hard(nh0_c), d], self.hit_ev[split2hard(nh0_c), d], \
-                            #             self.double_ev[split2hard(nh0_c), d], table1[nh0_c, d]) * 1/13.0
-                            else:
-                                EV_split0 += table0[split2hard(nh0_c), d] * 1/13.0**2
-
-                            if nh1_c is 'BJ':
-                                EV_split1 += self.stand_ev['21', d] * 1/13.0**2
-                            # EV_split0 += self.stand_ev['21', d]
-                            elif new_hand1.can_split():
-                                #EV_split1 +=  max(table0[split2hard(nh1_c), d], table1[nh1_c, d]) * 1/13.0
-                                EV_split1 +=  table1[nh1_c, d] * 1/13.0**2
-                            # EV_split0 += max(self.stand_ev[split2hard(nh0_c), d], self.hit_ev[split2hard(nh0_c), d], \
-                            #             self.double_ev[split2hard(nh0_c), d], table1[nh0_c, d]) * 1/13.0
-                            else:
-                                EV_split1 += table0[split2hard(nh1_c), d] * 1/13.0**2
-                            
-
-
-
-                    """ for k in range(1,14,1):
-                        if k == 1:
-                            new_hand0 = Hand(p[0], "A")
-                        elif k < 10:
-                            new_hand0 = Hand(p[0], str(k))
-                        else:
-                            new_hand0 = Hand(p[0], "T")
-
-                        nh0_c = new_hand0.code()
-                        #print(nh0_c)
-                        if nh0_c is 'BJ':
-                            EV_split0 += self.stand_ev['21', d] * 1/13.0
-                            # EV_split0 += self.stand_ev['21', d]
-                        elif new_hand0.can_split():
-                            EV_split0 +=  max(table0[split2hard(nh0_c), d], table1[nh0_c, d]) * 1/13.0
-                            #EV_split0 +=  table1[nh0_c, d] * 1/13.0
-                            # EV_split0 += max(self.stand_ev[split2hard(nh0_c), d], self.hit_ev[split2hard(nh0_c), d], \
-                            #             self.double_ev[split2hard(nh0_c), d], table1[nh0_c, d]) * 1/13.0
-                        else:
-                            EV_split0 += table0[split2hard(nh0_c), d] * 1/13.0
-                            # EV_split0 += max(self.stand_ev[nh0_c, d], self.hit_ev[nh0_c, d], \
-                            #             self.double_ev[nh0_c, d]) * 1/13.0
+    def make_split_table(self):
+        # make split_ev0 (base case)
+        self.make_split_ev0()
 
-                    
-                    for l in range(1,14,1):
-                        if l == 1:
-                            new_hand1 = Hand(p[1], "A")
-                        elif l < 10:
-                            new_hand1 = Hand(p[1], str(l))
-                        else:
-                            new_hand1 = Hand(p[1], "T")
-
-                        nh1_c = new_hand1.code()
-                        #print(nh0_c)
-                        # At the 3rd split, cannot split into over 21
-                        if nh1_c is 'BJ':
-                            EV_split1 += table0['21', d] * 1/13.0
-                        else:
-                            EV_split1 += table0[split2hard(nh1_c), d] * 1/13.0
-                            # EV_split1 += max(self.stand_ev[nh1_c, d], self.hit_ev[nh1_c, d], \
-                            #             self.double_ev[nh1_c, d]) * 1/13.0
-                    # table2[p, d] = max(self.stand_ev[split2hard(p), d], self.hit_ev[split2hard(p), d], \
-                    #                 self.double_ev[split2hard(p), d], EV_split0 + EV_split1) """
-                    
-                table2[p, d] = EV_split0 + EV_split1
-                '''
-                else:
-                    table2[p, d] = max(self.stand_ev[split2hard(p), d], self.hit_ev[split2hard(p), d], \
-                                    self.double_ev[split2hard(p), d])
-                '''
+        prob = np.array(self.prob)
 
+        # split aces get one card each unless they can be played out
+        aces = self.split_ev0 if self.rules.hit_split_aces else self.stand_ev
 
-        # make split_ev3
-        for p in traverse_order_p:
-            p_hand = Hand(p[0], p[1])
-            for d in traverse_order_d:
-                EV_split0 = 0.0 #new hand that re split
-                EV_split1 = 0.0 #new hand dose not resplit
-                if p_hand.can_split():
-                    for k in range(1, 14, 1):
-                        if k == 1:
-                            new_hand0 = Hand(p[0], "A")
-                        elif k < 10:
-                            new_hand0 = Hand(p[0], str(k))
-                        else:
-                            new_hand0 = Hand(p[0], "T")
-
-                        nh0_c = new_hand0.code()
-
-                        for l in range(1, 14, 1):
-                            if l == 1:
-                                new_hand1 = Hand(p[1], "A")
-                            elif l < 10:
-                                new_hand1 = Hand(p[1], str(l))
-                            else:
-                                new_hand1 = Hand(p[1], "T")
-
-                            nh1_c = new_hand1.code() 
-
-                            if p == 'AA':
-                                if nh0_c == 'BJ':
-                                    EV_split0 += self.stand_ev['21', d] * 1/13.0**2
-                                else:
-                                    EV_split0 += self.stand_ev[split2hard(nh0_c), d] * 1/13.0**2
-                                if nh1_c == 'BJ':
-                                    EV_split1 += self.stand_ev['21', d] * 1/13.0**2
-                                else:
-                                    EV_split1 += self.stand_ev[split2hard(nh1_c), d] * 1/13.0**2
-                                continue
-
-                            # the case that both hand can split
-                            if new_hand0.can_split() and new_hand1.can_split():
-                                EV_split0 += table1[nh0_c, d] * 1/13.0**2
-                                EV_split1 += table1[nh1_c, d] * 1/13.0**2
-                                continue
-                            
-                            if nh0_c is 'BJ':
-                                EV_split0 += self.stand_ev['21', d] * 1/13.0**2
-                            # EV_split0 += self.stand_ev['21', d]
-                            elif new_hand0.can_split():
-                                #EV_split0 +=  max(table0[split2hard(nh0_c), d], table1[nh0_c, d]) * 1/13.0
-                                EV_split0 +=  table2[nh0_c, d] * 1/13.0**2
-                            # EV_split0 += max(self.stand_ev[split2hard(nh0_c), d], self.hit_ev[split2hard(nh0_c), d], \
-                            #             self.double_ev[split2hard(nh0_c), d], table1[nh0_c, d]) * 1/13.0
-                            else:
-                                EV_split0 += table0[split2hard(nh0_c), d] * 1/13.0**2
-
-                            if nh1_c is 'BJ':
-                                EV_split1 += self.stand_ev['21', d] * 1/13.0**2
-                            # EV_split0 += self.stand_ev['21', d]
-                            elif new_hand1.can_split():
-                                #EV_split1 +=  max(table0[split2hard(nh1_c), d], table1[nh1_c, d]) * 1/13.0
-                                EV_split1 +=  table2[nh1_c, d] * 1/13.0**2
-                            # EV_split0 += max(self.stand_ev[split2hard(nh0_c), d], self.hit_ev[split2hard(nh0_c), d], \
-                            #             self.double_ev[split2hard(nh0_c), d], table1[nh0_c, d]) * 1/13.0
-                            else:
-                                EV_split1 += table0[split2hard(nh1_c), d] * 1/13.0**2
-
-                table3[p, d] = EV_split0 + EV_split1
-            """ for d in traverse_order_d:
-                EV_split0 = 0.0
-                if p_hand.can_split():
-                    for k in range(1,14,1):
-                        if k == 1:
-                            new_hand0 = Hand(p[0], "A")
-                        elif k < 10:
-                            new_hand0 = Hand(p[0], str(k))
-                        else:
-                            new_hand0 = Hand(p[0], "T")
-
-                        nh0_c = new_hand0.code()
-                        # At the 3rd split, cannot split into over 20
-                        if nh0_c is 'BJ':
-                            EV_split0 += self.stand_ev['21', d]
-                        elif new_hand0.can_split():
-                            if nh0_c is 'AA':
-                                EV_split0 += table0[nh0_c, d] * 1/13.0
-                            else:
-                                EV_split0 += table2[nh0_c, d] * 1/13.0
-                        else:
-                            nh0_c = split2hard(nh0_c)
-                            EV_split0 += max(self.stand_ev[nh0_c, d], self.hit_ev[nh0_c, d], \
-                                        self.double_ev[nh0_c, d]) * 1/13.0
-
-                    table3[p, d] = max(self.stand_ev[split2hard(p), d], self.hit_ev[split2hard(p), d], \
-                                    self.double_ev[split2hard(p), d], 2 * EV_split0)
-                else:
-                    table3[p, d] = max(self.stand_ev[split2hard(p), d], self.hit_ev[split2hard(p), d], \
-                                    self.double_ev[split2hard(p), d]) """
-        #print(table0)
-        #print(table1)
-        #print(table2)
+        for i, c in enumerate(DISTINCT):
+            p = c * 2
+            # code of the split hand after drawing each card (a pair is
+            # played as its total, an ace and ten as a plain 21)
+            start = STATE_NEXT[EMPTY][i]
+            codes = [ PLAYER_STATE_CODE[n] for n in STATE_NEXT[start] ]
 
-    # Make Hit EV table
-    def make_optimal_table(self):
-        table = self.optimal_ev
+            # split aces are never resplit
+            if c == 'A':
+                self.split_ev3.set_row(p, 2 * (prob @ aces.rows(codes)))
+                continue
 
-        # Traverse hands in bottom up order
-        traverse_order_p = PLAYER_CODE
-        traverse_order_d = DEALER_CODE
+            card_ev = self.split_ev0.rows(codes)
+            rest = prob @ card_ev - prob[i] * card_ev[i]
+            levels, EV = self.split_evs(prob[i], card_ev[i], rest)
+            for table, level in zip(self.resplit[1:], levels):
+                table.set_row(p, level)
+            self.split_ev3.set_row(p, EV)
 
-        for p in traverse_order_p:
-            
-            p_hand = None
-
-            # Initialize hand to the given cards (eg A6) or arbitrary cards that sum up to given sum (eg 20)
-            if p[0] == "A":
-                p_hand = Hand(p[0], p[1], dealer=True)
-            elif p == "20":
-                p_hand = Hand("T","T", dealer=True)
-            elif len(p) == 2 and p[0] == p[1]:
-                p_hand = Hand(p[0], p[1], dealer=True)
-            else:
-                p_hand = Hand(str(int((int(p)/2))),str(int(int(p)/2) + (int(p) %2 != 0)), dealer=True) 
+    # Make optimal EV table
+    def make_optimal_table(self):
+        # code of each hand as played without splitting (eg 22 plays as 4)
+        codes = [ PLAYER_STATE_CODE[PLAYER_CODE_STATE[p]] for p in PLAYER_CODE ]
 
-            for d in traverse_order_d:
+        # best of stand, hit, double and surrender (if allowed)
+        best = np.maximum.reduce([ self.stand_ev.rows(codes),
+            self.hit_ev.rows(codes), self.double_ev.rows(codes),
+            np.full(self.optimal_ev.table.shape, self.surrender_ev) ])
 
-                # print (p,d)
-                if p not in SPLIT_CODE:
-                    table[p,d] = max(self.stand_ev[p,d], self.hit_ev[p,d], self.double_ev[p,d], -0.5)
-                else:
-                    pc = p_hand.code()
-                    table[p,d] = max(self.stand_ev[pc,d], self.hit_ev[pc,d], self.double_ev[pc,d], self.split_ev3[p,d], -0.5)
+        # split hands can also split
+        split = [ PLAYER_CODE.index(p) for p in SPLIT_CODE ]
+        best[split] = np.maximum(best[split], self.split_ev3.rows(SPLIT_CODE))
+
+        self.optimal_ev.fill(best)
 
-            # Make Hit EV table
+    # Make strategy table
     def make_strategy_table(self):
 
         def add_alt_action (table,p,d,p_t = None):
@@ -765,72 +691,78 @@ class Calculator:
                 table[p_t,d] += 's'
 
         table = self.strategy
+        R = self.surrender_ev
 
         # Traverse hands in bottom up order
         traverse_order_p = PLAYER_CODE
-        traverse_order_d = DEALER_CODE
+        traverse_order_d = self.columns
 
         for p in traverse_order_p:
             
-            p_hand = None
-
-            # Initialize hand to the given cards (eg A6) or arbitrary cards that sum up to given sum (eg 20)
-            if p[0] == "A":
-                p_hand = Hand(p[0], p[1], dealer=True)
-            elif p == "20":
-                p_hand = Hand("T","T", dealer=True)
-            elif len(p) == 2 and p[0] == p[1]:
-                p_hand = Hand(p[0], p[1], dealer=True)
-            else:
-                p_hand = Hand(str(int((int(p)/2))),str(int(int(p)/2) + (int(p) %2 != 0)), dealer=True) 
+            # code of the hand as played without splitting (eg 22 plays as 4)
+            pc = PLAYER_STATE_CODE[PLAYER_CODE_STATE[p]]
 
             for d in traverse_order_d:
 
+                # a cell no deal reaches (eg a pair the shoe cannot deal)
+                # has no play
+                evs = [ self.stand_ev[pc,d], self.hit_ev[pc,d], self.double_ev[pc,d] ]
+                if p in SPLIT_CODE:
+                    evs.append(self.split_ev3[p,d])
+                if None in evs:
+                    continue
+
                 if p not in SPLIT_CODE:
                     
                     # Stand
-                    if max(self.hit_ev[p,d], self.double_ev[p,d], -0.5) < self.stand_ev[p,d]:
+                    if max(self.hit_ev[p,d], self.double_ev[p,d], R) < self.stand_ev[p,d]:
                         table[p,d] = 'S'
                     
                     # Hit
-                    elif max(self.stand_ev[p,d], self.double_ev[p,d], -0.5) < self.hit_ev[p,d]:
+                    elif max(self.stand_ev[p,d], self.double_ev[p,d], R) < self.hit_ev[p,d]:
                         table[p,d] = 'H'
                     
                     # Double
-                    elif max(self.stand_ev[p,d], self.hit_ev[p,d], -0.5) < self.double_ev[p,d]:
+                    elif max(self.stand_ev[p,d], self.hit_ev[p,d], R) < self.double_ev[p,d]:
                         table[p,d] = 'D'
                         add_alt_action(table,p,d)
                     
                     # Surrender
-                    else:
+                    elif self.rules.surrender:
                         table[p,d] = 'R'
                         add_alt_action(table,p,d)
 
+                    # Tie between the best actions
+                    else:
+                        table[p,d] = 'H' if self.stand_ev[p,d] < self.hit_ev[p,d] else 'S'
+
                 else:
-                    pc = p_hand.code()                    
-                    
                     # Split
-                    if max(self.hit_ev[pc,d], self.double_ev[pc,d], self.stand_ev[pc,d], -0.5) < self.split_ev3[p,d]:
+                    if max(self.hit_ev[pc,d], self.double_ev[pc,d], self.stand_ev[pc,d], R) < self.split_ev3[p,d]:
                         table[p,d] = 'P'
 
                     # Stand
-                    elif max(self.hit_ev[pc,d], self.double_ev[pc,d], self.split_ev3[p,d], -0.5) < self.stand_ev[pc,d]:
+                    elif max(self.hit_ev[pc,d], self.double_ev[pc,d], self.split_ev3[p,d], R) < self.stand_ev[pc,d]:
                         table[p,d] = 'S'
                     
                     # Hit
-                    elif max(self.stand_ev[pc,d], self.double_ev[pc,d], self.split_ev3[p,d], -0.5) < self.hit_ev[pc,d]:
+                    elif max(self.stand_ev[pc,d], self.double_ev[pc,d], self.split_ev3[p,d], R) < self.hit_ev[pc,d]:
                         table[p,d] = 'H'
                     
                     # Double
-                    elif max(self.stand_ev[pc,d], self.hit_ev[pc,d], self.split_ev3[p,d], -0.5) < self.double_ev[pc,d]:
+                    elif max(self.stand_ev[pc,d], self.hit_ev[pc,d], self.split_ev3[p,d], R) < self.double_ev[pc,d]:
                         table[p,d] = 'D'
                         add_alt_action(table,pc,d,p)
                     
                     # Surrender
-                    else:
+                    elif self.rules.surrender:
                         table[p,d] = 'R'
                         add_alt_action(table,pc,d,p)
 
+                    # Tie between the best actions
+                    else:
+                        table[p,d] = 'H' if self.stand_ev[pc,d] < self.hit_ev[pc,d] else 'S'
+
 
                 
 
@@ -842,11 +774,14 @@ class Calculator:
 
         for d in dealer_hands:
             for p in INITIAL_CODE:
+                # skip the cells never dealt (their EVs are empty)
+                if not self.initprob[p, d]:
+                    continue
                 if p == 'BJ':
                     if d == 'BJ':
                         player_adventage += self.initprob[p, d] * 0
                     else:
-                        player_adventage += self.initprob[p, d] * 1.5
+                        player_adventage += self.initprob[p, d] * self.rules.blackjack_pays
                 elif d == 'BJ':
                     player_adventage += self.initprob[p, d] * -1
                 else:
@@ -854,71 +789,573 @@ class Calculator:
 
         self.advantage = player_adventage
 #
+# Returns the count of each card in DISTINCT in a shoe of the given decks
+#
+def shoe_counts(decks):
+    return tuple(decks * 4 * (NUM_FACES if c == 'T' else 1) for c in DISTINCT)
+
+# return the counts left after removing one card at index k of DISTINCT
+def _remove(counts, k):
+    return counts[:k] + (counts[k] - 1,) + counts[k+1:]
+
+# return the probability of drawing the given cards in order from a shoe
+def draw_probability(counts, cards):
+    prob = 1.
+    for c in cards:
+        k = DISTINCT.index(c)
+        if counts[k] == 0:
+            return 0.
+        prob *= counts[k] / sum(counts)
+        counts = _remove(counts, k)
+    return prob
+
+#
+# Calculator for a finite shoe where every card drawn is removed from it
+#
+# Each cell is the average EV of all the initial deals that land in the
+# cell, weighted by the probability of the deal. The EV of a deal is exact
+# for the shoe left after it, with sub-results memoized on the remaining
+# composition so draw sequences shared between deals are only walked once.
+# Split hands each play from the shoe left after the initial deal.
+#
+class ShoeCalculator(Calculator):
+    def __init__(self, counts, rules=None, instrument=False, columns=None):
+        super().__init__(rules, instrument, columns=columns)
+        if len(counts) != len(DISTINCT):
+            raise ValueError("expected a count for each of %s"%"".join(DISTINCT))
+        self.counts = tuple(int(c) for c in counts)
+        self.dealer_stand = dealer_stand_list(self.rules.hit_soft17)
+        self.dealer_memo = {}
+        self.hit_memo = {}
+        self.memo_hits = 0
+        # only the deals of the columns filled are played
+        self.deals = [ deal for deal in self.make_deals() if deal[4] in self.columns ]
+
+    # the card probabilities change as cards leave the shoe (see counts)
+    def recalculate(self, prob):
+        raise TypeError("only an infinite deck calculator can be recalculated")
+
+    def run(self, stage):
+        super().run(stage)
+        self.free_deals()
+
+    def mark_done(self, stages):
+        super().mark_done(stages)
+        self.free_deals()
+
+    # free the memos and deals once no stage left needs them (they can take
+    # hundreds of MB for a shoe of many decks)
+    def free_deals(self):
+        if self.deals and self.done.issuperset(DEAL_STAGES):
+            self.dealer_memo.clear()
+            self.hit_memo.clear()
+            self.deals = []
+
+    #
+    # Returns the probability of every initial deal, in the order of
+    # initial_cells(), with each card drawn from the shoe left by the cards
+    # before it (the same products as draw_probability())
+    #
+    def deal_weights(self):
+        n = len(DISTINCT)
+        counts = np.array(self.counts)
+        total = int(counts.sum())
+        eye = np.eye(n, dtype=counts.dtype)
+        # cards of each rank left before the second, third and fourth card
+        left2 = counts - eye
+        left3 = counts - eye[:, None, :] - eye[None, :, :]
+        left4 = left3[:, :, None, :] - eye[None, None, :, :]
+        first = counts / total
+        second = np.maximum(left2, 0) / (total - 1)
+        third = np.maximum(left3, 0) / (total - 2)
+        fourth = np.maximum(left4, 0) / (total - 3)
+        return (first[:, None, None, None] * second[:, :, None, None] *
+            third[:, :, :, None] * fourth).ravel()
+
+    # running counts of the operations the instrumentation reports
+    def counters(self):
+        counters = super().counters()
+        counters['memo_hits'] = self.memo_hits
+        counters['memo_entries'] = len(self.dealer_memo) + len(self.hit_memo)
+        return counters
+
+    #
+    # Groups every initial deal by its dealer and player cards. Each deal is
+    # a tuple (probability, player state, player code, dealer state, dealer
+    # code, pair card index or None, shoe left after the deal)
+    #
+    def make_deals(self):
+        groups = defaultdict(float)
+        n = len(DISTINCT)
+        for i in range(n):
+            for j in range(n):
+                for x in range(n):
+                    for y in range(n):
+                        cards = [ DISTINCT[k] for k in (i, j, x, y) ]
+                        prob = draw_probability(self.counts, cards)
+                        if prob > 0:
+                            key = (min(i, j), max(i, j), min(x, y), max(x, y))
+                            groups[key] += prob
+
+        deals = []
+        for (i, j, x, y), prob in groups.items():
+            counts = self.counts
+            for k in (i, j, x, y):
+                counts = _remove(counts, k)
+            ps = hand_state(DISTINCT[x] + DISTINCT[y])
+            ds = hand_state(DISTINCT[i] + DISTINCT[j])
+            pc = 'BJ' if ps == 21 else PLAYER_STATE_CODE[ps]
+            dc = 'BJ' if ds == 21 else DEALER_STATE_CODE[ds]
+            deals.append((prob, ps, pc, ds, dc, x if x == y else None, counts))
+        return deals
+
+    # probability of each final dealer outcome from a state and shoe
+    def dealer_final(self, state, counts):
+        if self.dealer_stand[state]:
+            return DEALER_FINAL[state]
+        key = (state, counts)
+        dist = self.dealer_memo.get(key)
+        if dist is not None:
+            self.memo_hits += 1
+            return dist
+
+        total = sum(counts)
+        if total == 0:
+            raise ValueError("shoe ran out of cards")
+        dist = [ 0. ] * len(DEALER_OUTCOMES)
+        for k, c in enumerate(counts):
+            if c:
+                sub = self.dealer_final(STATE_NEXT[state][k], _remove(counts, k))
+                w = c / total
+                dist = [ a + w * b for a, b in zip(dist, sub) ]
+        self.dealer_memo[key] = dist
+        return dist
+
+    # EV of standing on a player state
+    def stand_value(self, player, dealer, counts):
+        total = state_total(player)
+        EV = 0.
+        for t, q in zip(DEALER_OUTCOMES, self.dealer_final(dealer, counts)):
+            if t < total:
+                EV += q
+            elif t > total:
+                EV -= q
+        return EV
+
+    # EV of hitting a player state and then playing on optimally
+    def hit_value(self, player, dealer, counts):
+        key = (player, dealer, counts)
+        EV = self.hit_memo.get(key)
+        if EV is not None:
+            self.memo_hits += 1
+            return EV
+
+        EV = 0.
+        total = sum(counts)
+        for k, c in enumerate(counts):
+            if c:
+                n = STATE_NEXT[player][k]
+                rest = _remove(counts, k)
+                if n == BUST:
+                    EV -= c / total
+                elif n == 21:
+                    EV += c / total * self.stand_value(n, dealer, rest)
+                else:
+                    EV += c / total * max(self.stand_value(n, dealer, rest),
+                        self.hit_value(n, dealer, rest))
+        self.hit_memo[key] = EV
+        return EV
+
+    # EV of doubling a player state
+    def double_value(self, player, dealer, counts):
+        EV = 0.
+        total = sum(counts)
+        for k, c in enumerate(counts):
+            if c:
+                n = STATE_NEXT[player][k]
+                if n == BUST:
+                    EV -= 2 * c / total
+                else:
+                    EV += 2 * c / total * self.stand_value(n, dealer, _remove(counts, k))
+        return EV
+
+    # best EV of a split hand that can no longer split
+    def best_value(self, player, dealer, counts):
+        if player == 21:
+            return self.stand_value(player, dealer, counts)
+        EV = max(self.stand_value(player, dealer, counts),
+            self.hit_value(player, dealer, counts))
+        if self.rules.double_after_split:
+            EV = max(EV, self.double_value(player, dealer, counts))
+        return EV
+
+    #
+    # Returns the split EVs of a pair (see Calculator.split_evs()) for the
+    # shoe left after the deal. Split aces are never resplit: they have no
+    # levels.
+    #
+    def split_values(self, pair, dealer, counts):
+        total = sum(counts)
+        start = STATE_NEXT[EMPTY][pair]
+
+        # EV of each split hand, by the card drawn to it, if it cannot split
+        card_ev = []
+        for k, c in enumerate(counts):
+            if c == 0:
+                card_ev.append(0.)
+                continue
+            n = STATE_NEXT[start][k]
+            rest = _remove(counts, k)
+            if DISTINCT[pair] == 'A' and not self.rules.hit_split_aces:
+                card_ev.append(self.stand_value(n, dealer, rest))
+            else:
+                card_ev.append(self.best_value(n, dealer, rest))
+
+        q = counts[pair] / total
+        rest = sum(c / total * ev for k, (c, ev) in
+            enumerate(zip(counts, card_ev)) if k != pair)
+        pair_ev = card_ev[pair]
+
+        if DISTINCT[pair] == 'A':
+            return [], 2 * (q * pair_ev + rest)
+        return self.split_evs(q, pair_ev, rest)
+
+    #
+    # Fills the cells of a table with the average of a value over all the
+    # initial deals, weighted by the probability of each deal
+    #
+    # table: table to fill
+    # value: function of a deal returning (row label, value), or None to
+    #        leave the deal out
+    #
+    def fill_average(self, table, value):
+        total = Table(float, table.xlabels, table.ylabels)
+        weight = Table(float, table.xlabels, table.ylabels)
+        total.fill(np.zeros(total.table.shape))
+        weight.fill(np.zeros(weight.table.shape))
+
+        for deal in self.deals:
+            prob, dc = deal[0], deal[4]
+            if dc not in table.xindex:
+                continue
+            cell = value(deal)
+            if cell is None:
+                continue
+            p, ev = cell
+            total[p,dc] += prob * ev
+            weight[p,dc] += prob
+
+        with np.errstate(invalid='ignore'):
+            table.fill(np.where(weight.table > 0,
+                total.table / weight.table, np.nan))
+
+    # Calculate the dealer table probabilities
+    def make_dealer_table(self):
+        table = self.dealprob
+        dist = defaultdict(lambda: [ 0. ] * len(DEALER_OUTCOMES))
+        weight = defaultdict(float)
+
+        for prob, ps, pc, ds, dc, pair, counts in self.deals:
+            if dc == 'BJ':
+                continue
+            for t, q in enumerate(self.dealer_final(ds, counts)):
+                dist[dc][t] += prob * q
+            weight[dc] += prob
+
+        for d in self.columns:
+            # a dealer code no deal from this shoe reaches has no outcomes
+            # (and every cell of its column is left empty)
+            if not weight[d]:
+                table[d] = {}
+                continue
+            row = [ q / weight[d] for q in dist[d] ]
+            table[d] = { str(t): q for t, q in zip(DEALER_OUTCOMES, row) if q > 0 }
+            assert isclose(sum(row))
+
+    # make stand EV table
+    def make_stand_table(self):
+        def value(deal):
+            prob, ps, pc, ds, dc, pair, counts = deal
+            return PLAYER_STATE_CODE[ps], self.stand_value(ps, ds, counts)
+        self.fill_average(self.stand_ev, value)
+
+    # make double EV table
+    def make_double_table(self):
+        def value(deal):
+            prob, ps, pc, ds, dc, pair, counts = deal
+            if pc == 'BJ':
+                return None
+            return PLAYER_STATE_CODE[ps], self.double_value(ps, ds, counts)
+        self.fill_average(self.double_ev, value)
+
+    # Make Hit EV table
+    def make_hit_table(self):
+        def value(deal):
+            prob, ps, pc, ds, dc, pair, counts = deal
+            if pc == 'BJ':
+                return None
+            return PLAYER_STATE_CODE[ps], self.hit_value(ps, ds, counts)
+        self.fill_average(self.hit_ev, value)
+
+    def make_split_table(self):
+        self.make_split_ev0()
+
+        # split EVs of every pair deal
+        splits = {}
+        for prob, ps, pc, ds, dc, pair, counts in self.deals:
+            if pair is not None and dc != 'BJ':
+                splits[pair, ds, counts] = self.split_values(pair, ds, counts)
+
+        def level_value(i):
+            def value(deal):
+                prob, ps, pc, ds, dc, pair, counts = deal
+                if pair is None or DISTINCT[pair] == 'A':
+                    return None
+                return DISTINCT[pair] * 2, splits[pair, ds, counts][0][i]
+            return value
+        for i, table in enumerate(self.resplit[1:]):
+            self.fill_average(table, level_value(i))
+
+        def value(deal):
+            prob, ps, pc, ds, dc, pair, counts = deal
+            if pair is None:
+                return None
+            return DISTINCT[pair] * 2, splits[pair, ds, counts][1]
+        self.fill_average(self.split_ev3, value)
+
+#
 # Calculate all the ev tables and the final strategy table and return them
 # all in a dictionary
-#      
-def calculate():
-    calc = Calculator()   
-    
-    calc.make_initial_table(calc.make_initial_cell)
-    
-    # TODO: uncomment once you finished your table implementation
-    #       and Hand.code implementation
-    calc.verify_initial_table()
-
-    # TODO: calculate all other tables and numbers
-
-    # Dealer Table
-    calc.make_dealer_table()
-
-    # Stand EV table
-    calc.make_initial_table(calc.make_stand_cell)
-
-    # Double EV table
-    calc.make_double_table()
-
-    # Hit EV table
-    calc.make_hit_table()
-
-    calc.make_split_table()
-
-    calc.make_optimal_table()
-
-    calc.calc_advantage()
-
-    calc.make_strategy_table()
-
-    return {
-        'initial' : calc.initprob,
-        'dealer' : calc.dealprob,
-        'stand' : calc.stand_ev,
-        'hit' : calc.hit_ev,
-        'double' : calc.double_ev,
-        'split' : calc.split_ev3,
-        "resplit" : [ 
-            calc.split_ev0,
-            calc.split_ev1,
-            calc.split_ev2,
-        ],
-        'optimal' : calc.optimal_ev,
-        'strategy' : calc.strategy,
-        'advantage' : calc.advantage,
-    }
-
-
-def split2hard(split_str):
-    if split_str is 'AA':
-        return '12'
-    elif split_str is 'TT':
-        return str(20)
-    elif len(split_str) == 2:
-        if split_str[0] == split_str[1]:
-            if split_str[0] == '1':
-                return str(11)
-            else:
-                return str(int(split_str[0]) + int(split_str[1]))
-        else:
-            return split_str
+#
+# rules: Rules of the game (the default game if None)
+# decks: number of decks in a finite shoe, overrides rules.decks
+# counts: count of each card in DISTINCT left in a finite shoe, used
+#         instead of the decks
+# prob: probability (or weight) of drawing each card in DISTINCT from an
+#       infinite deck, instead of the probabilities of a full deck
+# cache_dir: directory of the on-disk result cache (defaults to the
+#            EASYBJ_CACHE environment variable, no disk cache if unset)
+# instrument: record the time and operation counts of every stage in the
+#             instrumentation dict of the results (defaults to whether
+#             the EASYBJ_INSTRUMENT environment variable is set)
+# workers: number of worker processes to spread the dealer codes over
+#          (see make_parallel_calculator(), None or 1 calculates in this
+#          process)
+#
+# Returns a mapping of result name to result where each result is only
+# calculated, with the stages it needs, when first looked up. Results are
+# kept in a least recently used cache keyed on the rules and shoe, so the
+# tables returned are shared between calls with the same arguments and
+# must not be modified.
+#
+def calculate(rules=None, decks=None, counts=None, cache_dir=None,
+        instrument=None, prob=None, workers=None):
+    rules = Rules() if rules is None else rules
+    if decks is not None:
+        rules = rules._replace(decks=decks)
+    if counts is not None:
+        counts = tuple(int(c) for c in counts)
+    if prob is not None:
+        prob = rank_probabilities(prob)
+    if cache_dir is None:
+        cache_dir = os.environ.get('EASYBJ_CACHE') or None
+    if instrument is None:
+        instrument = os.environ.get('EASYBJ_INSTRUMENT', '0') not in ('', '0')
+    if workers == 1:
+        workers = None
+    results = _calculate(rules, counts, cache_dir, instrument, prob, workers)
+    if instrument:
+        results.instrumentation['lru_cache'] = _calculate.cache_info()._asdict()
+    return results
+
+# number of results kept by calculate()
+CACHE_SIZE = 64
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _calculate(rules, counts, cache_dir, instrument, prob, workers):
+    def make():
+        if workers is None:
+            return make_calculator(rules, counts, instrument, prob)
+        return make_parallel_calculator(rules, counts, instrument, prob, workers)
+
+    if cache_dir is None:
+        return Results(make())
+
+    key = resultcache.cache_key(rules, counts, prob)
+    loaded = resultcache.load(cache_dir, key)
+    if loaded is None:
+        # a disk cache entry holds every result
+        results = Results(make())
+        resultcache.save(cache_dir, key, dict(results))
     else:
-        return split_str
+        results = Results(values=loaded,
+            instrumentation={ 'stages': {} } if instrument else None)
+    if instrument:
+        results.instrumentation['disk_cache'] = 'miss' if loaded is None else 'hit'
+    return results
+
+#
+# Returns a new calculator for the rules and shoe (no stage run yet)
+#
+# rules: Rules of the game (the default game if None)
+# counts: count of each card in DISTINCT left in a finite shoe, used
+#         instead of rules.decks
+# prob: probability of drawing each card from an infinite deck (see
+#       rank_probabilities())
+# columns: dealer codes whose columns the per column stages fill (all if
+#          None)
+#
+def make_calculator(rules=None, counts=None, instrument=False, prob=None,
+        columns=None):
+    rules = Rules() if rules is None else rules
+    if prob is not None:
+        if counts is not None or rules.decks is not None:
+            raise ValueError("card probabilities are only for an infinite deck")
+        return Calculator(rules, instrument, prob, columns)
+    if counts is None and rules.decks is not None:
+        counts = shoe_counts(rules.decks)
+    if counts is None:
+        return Calculator(rules, instrument, columns=columns)
+    return ShoeCalculator(counts, rules, instrument, columns)
+
+# stages whose every column only depends on its own dealer code
+COLUMN_STAGES = ('dealer', 'stand', 'hit', 'double', 'split', 'optimal', 'strategy')
+
+# Calculator tables filled one dealer code column at a time
+COLUMN_TABLES = ('stand_ev', 'hit_ev', 'double_ev', 'split_ev0', 'split_ev3',
+    'optimal_ev', 'strategy')
+
+# run the column stages of some dealer codes and return their tables (runs
+# in a worker process)
+def _calculate_columns(args):
+    rules, counts, prob, columns = args
+    calc = make_calculator(rules, counts, prob=prob, columns=columns)
+    for stage in COLUMN_STAGES:
+        calc.run(stage)
+    return columns, calc.dealprob, [ getattr(calc, a) for a in COLUMN_TABLES ] + \
+        calc.resplit[1:]
+
+#
+# Returns a calculator as make_calculator() does with the column stages
+# (COLUMN_STAGES) already run, each dealer code on a process pool
+#
+# workers: number of worker processes
+#
+# Every column of the tables made after the dealer table only depends on
+# its own dealer code, so each worker fills some of the columns and the
+# columns are copied into the calculator returned. The initial table and
+# the advantage are left to run in this process. This pays off for a
+# finite shoe, where each column plays out its own deals; an infinite deck
+# calculates in milliseconds and only gains the pool start up.
+#
+def make_parallel_calculator(rules=None, counts=None, instrument=False,
+        prob=None, workers=None):
+    calc = make_calculator(rules, counts, instrument, prob)
+    counts = getattr(calc, 'counts', None)
+    workers = workers or os.cpu_count() or 1
+    start = time.perf_counter()
+
+    # one task per worker, each a run of neighbouring dealer codes: a shoe
+    # calculator shares much of its memos between the columns of close
+    # dealer totals (one task per dealer code does 4 times the work)
+    n = len(DEALER_CODE)
+    tasks = [ (calc.rules, counts, prob, DEALER_CODE[i * n // workers:
+        (i + 1) * n // workers]) for i in range(min(workers, n)) ]
+    with ProcessPoolExecutor(workers) as pool:
+        for columns, dealprob, tables in pool.map(_calculate_columns, tasks):
+            for d in columns:
+                calc.dealprob[d] = dealprob[d]
+                for table, part in zip([ getattr(calc, a) for a in COLUMN_TABLES ] +
+                        calc.resplit[1:], tables):
+                    table.set_column(d, part.column(d))
+    calc.mark_done(COLUMN_STAGES)
+
+    if calc.stats is not None:
+        calc.stats['parallel'] = { 'time': time.perf_counter() - start,
+            'workers': workers, 'tasks': len(tasks) }
+    return calc
+
+#
+# Stages of the calculator: each stage maps to the stages it needs and the
+# Calculator method that runs it
+#
+# stages of a ShoeCalculator that walk the deals (and fill its memos)
+DEAL_STAGES = ('dealer', 'stand', 'hit', 'double', 'split')
+
+STAGES = {
+    'initial' : ((), 'make_initial'),
+    'dealer' : ((), 'make_dealer_table'),
+    'stand' : (('dealer',), 'make_stand_table'),
+    'hit' : (('stand',), 'make_hit_table'),
+    'double' : (('stand',), 'make_double_table'),
+    'split' : (('hit', 'double'), 'make_split_table'),
+    'optimal' : (('split',), 'make_optimal_table'),
+    'strategy' : (('split',), 'make_strategy_table'),
+    'advantage' : (('initial', 'optimal'), 'calc_advantage'),
+}
 
+#
+# Results of calculate(), in output order: each result maps to the stage
+# that makes it and the Calculator attribute holding it (a tuple of
+# attributes is returned as a list)
+#
+RESULTS = {
+    'initial' : ('initial', 'initprob'),
+    'dealer' : ('dealer', 'dealprob'),
+    'stand' : ('stand', 'stand_ev'),
+    'hit' : ('hit', 'hit_ev'),
+    'double' : ('double', 'double_ev'),
+    'split' : ('split', 'split_ev3'),
+    'resplit' : ('split', 'resplit'),
+    'optimal' : ('optimal', 'optimal_ev'),
+    'strategy' : ('strategy', 'strategy'),
+    'advantage' : ('advantage', 'advantage'),
+}
+
+#
+# Read-only mapping of result name to result. A result is only calculated
+# (together with the stages it needs) the first time it is looked up.
+#
+# calc: calculator making the results
+# values: results already made (eg loaded from the disk cache), used
+#         instead of a calculator
+# instrumentation: stats of the results when there is no calculator
+#
+# The instrumentation attribute holds the stats of the calculator (None
+# if it is not instrumented). Once every stage has run the results are
+# kept as values and the calculator is let go, so a cached Results holds
+# only its tables.
+#
+class Results(Mapping):
+    def __init__(self, calc=None, values=None, instrumentation=None):
+        self.calc = calc
+        self.values = values
+        self.instrumentation = calc.stats if calc else instrumentation
+
+    def __getitem__(self, name):
+        if name not in RESULTS:
+            raise KeyError(name)
+        if self.values is not None:
+            return self.values[name]
+        stage, attr = RESULTS[name]
+        self.calc.run(stage)
+        value = self.result(attr)
+        if self.calc.done.issuperset(STAGES):
+            self.values = { n: self.result(a) for n, (s, a) in RESULTS.items() }
+            self.calc = None
+        return value
+
+    # return a result of the calculator from its attribute (or attributes)
+    def result(self, attr):
+        if isinstance(attr, tuple):
+            return [ getattr(self.calc, a) for a in attr ]
+        return getattr(self.calc, attr)
+
+    def __contains__(self, name):
+        return name in RESULTS
+
+    def __iter__(self):
+        return iter(RESULTS)
+
+    def __len__(self):
+        return len(RESULTS)
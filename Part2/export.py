@@ -0,0 +1,226 @@
+#!/usr/bin/python3
+#
+# export.py
+#
+# Export every result of easybj.calculate() to a file for other tools, as
+# CSV, JSON or binary arrays, and load such a file back
+#
+# Example:
+#   python3 export.py results.json --hit_soft17 0 --decks 6
+#
+# CSV: one line per cell with the columns of CSV_FIELDS. kind is table,
+#      list (level numbers the tables of a list result, eg resplit), dict
+#      (the dealer outcome table, row is the dealer code and column the
+#      final total) or float (a single value with no row or column). An
+#      empty cell has an empty value.
+# JSON: an object of result name to result. A table is {"unit", "columns",
+#      "rows", "cells"} with null for an empty cell, a list result is a
+#      list of tables, the dealer result is its dict of dicts.
+# npz: the arrays of resultcache.to_arrays() in a compressed NumPy archive
+#      (the layout of the disk cache).
+#
+# Each table is written from its whole array in one pass.
+#
+
+import argparse
+import csv
+import json
+import math
+import os
+import sys
+
+import numpy as np
+
+import easybj
+import resultcache
+from rules import Rules
+from sweep import RULE_TYPES
+from table import Table
+
+# columns of the CSV format
+CSV_FIELDS = ('result', 'kind', 'level', 'unit', 'row', 'column', 'value')
+
+# file formats by extension
+FORMATS = ('csv', 'json', 'npz')
+
+# return the cells of a table as nested lists (None for an empty cell)
+def table_cells(table):
+    if table.celltype is float:
+        return [ [ None if math.isnan(v) else v for v in row ]
+            for row in table.table.tolist() ]
+    return [ table.row(y) for y in table.ylabels ]
+
+# return the format of a path from its extension
+def path_format(path):
+    fmt = os.path.splitext(path)[1][1:].lower()
+    if fmt not in FORMATS:
+        raise ValueError("unknown export format of %s (expected one of %s)"%(
+            path, ", ".join(FORMATS)))
+    return fmt
+
+# write the CSV lines of one table
+def _write_table(writer, name, kind, level, table):
+    for y, row in zip(table.ylabels, table_cells(table)):
+        writer.writerows([ name, kind, level, table.unit, y, x,
+            '' if v is None else repr(v) if table.celltype is float else v ]
+            for x, v in zip(table.xlabels, row))
+
+def write_csv(results, f):
+    writer = csv.writer(f, lineterminator='\n')
+    writer.writerow(CSV_FIELDS)
+    for name, value in results.items():
+        if isinstance(value, Table):
+            _write_table(writer, name, 'table', '', value)
+        elif isinstance(value, list):
+            for i, t in enumerate(value):
+                _write_table(writer, name, 'list', i, t)
+        elif isinstance(value, dict):
+            writer.writerows([ name, 'dict', '', '', y, x, repr(v) ]
+                for y, row in value.items() for x, v in row.items())
+        else:
+            writer.writerow([ name, 'float', '', '', '', '', repr(float(value)) ])
+
+#
+# Rebuilds a results dict from the lines of write_csv(). Labels keep the
+# order they first appear in.
+#
+def read_csv(f):
+    reader = csv.reader(f)
+    if tuple(next(reader, ())) != CSV_FIELDS:
+        raise ValueError("not an exported CSV file (expected columns %s)"%
+            ",".join(CSV_FIELDS))
+    cells = {}
+    for name, kind, level, unit, y, x, v in reader:
+        if kind == 'float':
+            cells[name] = (kind, float(v))
+            continue
+        result = cells.setdefault(name, (kind, {}))[1]
+        key = int(level) if kind == 'list' else None
+        result.setdefault(key, (unit, {}))[1].setdefault(y, {})[x] = v
+
+    results = {}
+    for name, (kind, value) in cells.items():
+        if kind == 'float':
+            results[name] = value
+        elif kind == 'dict':
+            results[name] = { y: { x: float(v) for x, v in row.items() }
+                for y, row in value[None][1].items() }
+        else:
+            tables = [ _csv_table(*value[k]) for k in sorted(value, key=lambda k: k or 0) ]
+            results[name] = tables if kind == 'list' else tables[0]
+    return results
+
+# return the Table of the rows read from CSV lines
+def _csv_table(unit, rows):
+    ylabels = list(rows)
+    xlabels = list(dict.fromkeys(x for row in rows.values() for x in row))
+    cells = [ [ rows[y].get(x, '') for x in xlabels ] for y in ylabels ]
+    try:
+        values = np.array([ [ float(v) if v else np.nan for v in row ]
+            for row in cells ])
+        table = Table(float, xlabels, ylabels, unit)
+    except ValueError:
+        values = [ [ v or None for v in row ] for row in cells ]
+        table = Table(str, xlabels, ylabels, unit)
+    table.fill(values)
+    return table
+
+# return the JSON object of a table
+def _table_json(table):
+    return { 'unit': table.unit, 'columns': list(table.xlabels),
+        'rows': list(table.ylabels), 'cells': table_cells(table) }
+
+# return the JSON object of one result
+def result_json(value):
+    if isinstance(value, Table):
+        return _table_json(value)
+    if isinstance(value, list):
+        return [ _table_json(t) for t in value ]
+    if isinstance(value, dict):
+        return value
+    return float(value)
+
+def write_json(results, f):
+    json.dump({ name: result_json(value) for name, value in results.items() }, f)
+
+# return the Table of a JSON table object
+def _json_table(obj):
+    cells = obj['cells']
+    if all(isinstance(v, (float, int)) for row in cells for v in row if v is not None):
+        table = Table(float, obj['columns'], obj['rows'], obj['unit'])
+        table.fill([ [ np.nan if v is None else v for v in row ] for row in cells ])
+    else:
+        table = Table(str, obj['columns'], obj['rows'], obj['unit'])
+        table.fill(cells)
+    return table
+
+# rebuilds a results dict from the object of write_json()
+def read_json(f):
+    results = {}
+    for name, value in json.load(f).items():
+        if isinstance(value, list):
+            results[name] = [ _json_table(t) for t in value ]
+        elif isinstance(value, dict) and 'cells' in value:
+            results[name] = _json_table(value)
+        else:
+            results[name] = value
+    return results
+
+#
+# Writes results (a mapping as returned by easybj.calculate()) to a file
+#
+# path: file to write
+# fmt: one of FORMATS (default: from the extension of path)
+#
+def export(results, path, fmt=None):
+    fmt = fmt or path_format(path)
+    results = dict(results)
+    if fmt == 'npz':
+        with open(path, 'wb') as f:
+            np.savez_compressed(f, **resultcache.to_arrays(results))
+    elif fmt == 'json':
+        with open(path, 'w') as f:
+            write_json(results, f)
+    elif fmt == 'csv':
+        with open(path, 'w', newline='') as f:
+            write_csv(results, f)
+    else:
+        raise ValueError("unknown export format %s"%fmt)
+
+#
+# Returns the results dict of a file written by export(), with the same
+# tables, lists, dicts and floats as easybj.calculate()
+#
+def load(path, fmt=None):
+    fmt = fmt or path_format(path)
+    if fmt == 'npz':
+        with np.load(path) as data:
+            return resultcache.from_arrays(data)
+    if fmt == 'json':
+        with open(path) as f:
+            return read_json(f)
+    if fmt == 'csv':
+        with open(path, newline='') as f:
+            return read_csv(f)
+    raise ValueError("unknown export format %s"%fmt)
+
+#
+# Parses command line, calculates the results of the rules and exports them
+#
+def main(argv):
+    parser = argparse.ArgumentParser(prog=argv[0],
+        description="Export the calculated results.")
+    parser.add_argument('output', help="file to write (.csv, .json or .npz)")
+    parser.add_argument('--format', choices=FORMATS, default=None,
+        help="file format (default: from the extension of output)")
+    for name in Rules._fields:
+        parser.add_argument('--' + name, type=RULE_TYPES[name],
+            default=Rules._field_defaults[name])
+    args = parser.parse_args(argv[1:])
+
+    rules = Rules(**{ name: getattr(args, name) for name in Rules._fields })
+    export(easybj.calculate(rules), args.output, args.format)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
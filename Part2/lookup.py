@@ -0,0 +1,152 @@
+#!/usr/bin/python3
+#
+# lookup.py
+#
+# Compiled strategy lookup: the strategy table flattened into one array
+# indexed by integer (player key, dealer state) so a decision is a single
+# array read, with batch lookups over NumPy arrays of hands
+#
+# A player key is the hand state of easybj (see NUM_STATES), or
+# PAIR_KEY + rank for a pair that may be split. Each entry packs the play
+# in the low four bits and the fallback (the play when doubling or
+# surrendering is not allowed) in the high four bits.
+#
+
+import numpy as np
+
+from easybj import (BUST, EMPTY, NUM_STATES, STATE_NEXT, PLAYER_CODE, DEALER_CODE,
+    DISTINCT, PLAYER_STATE_CODE, DEALER_STATE_CODE)
+
+# actions, in the order of ACTION_LETTERS
+STAND, HIT, DOUBLE, SPLIT, SURRENDER = range(5)
+ACTION_LETTERS = 'SHDPR'
+
+# first player key of the pairs
+PAIR_KEY = NUM_STATES
+
+# number of player keys
+NUM_KEYS = NUM_STATES + len(DISTINCT)
+
+# successor state of every state for each card, as an array
+NEXT = np.array(STATE_NEXT, dtype=np.int8)
+
+# strategy row of every player key (None if the table has no row for it)
+KEY_ROW = [ c if c in PLAYER_CODE and c != 'AA' else None
+    for c in PLAYER_STATE_CODE ] + [ c * 2 for c in DISTINCT ]
+
+# return the packed entry of a play and its fallback
+def pack(play, fallback):
+    return play | fallback << 4
+
+#
+# Returns the state of every hand in a batch
+#
+# cards: integer array (hands, cards) of rank indices into DISTINCT, with
+#        -1 after the last card of a shorter hand
+#
+def hand_states(cards):
+    cards = np.asarray(cards)
+    state = np.full(cards.shape[0], EMPTY, dtype=np.int8)
+    for k in range(cards.shape[1]):
+        held = cards[:, k] >= 0
+        state[held] = NEXT[state[held], cards[held, k]]
+    return state
+
+#
+# Strategy table compiled for constant time lookups
+#
+# strategy: strategy Table (rows PLAYER_CODE, columns DEALER_CODE)
+#
+# A hand with no row of its own (a soft 12 that cannot be split, or a
+# total the player never decides on) is hit; every card improves a soft
+# 12 or leaves a hard 12 it can stand on. A 21 (soft 21 is a hard 21) or
+# a busted hand has no decision and stands.
+#
+class StrategyLookup:
+    def __init__(self, strategy):
+        self.table = np.full((NUM_KEYS, NUM_STATES), pack(HIT, HIT), dtype=np.uint8)
+        self.table[[ 21, BUST ]] = pack(STAND, STAND)
+        for key, row in enumerate(KEY_ROW):
+            if row is None:
+                continue
+            actions = strategy.row(row)
+            for d, dc in enumerate(DEALER_STATE_CODE):
+                if dc in DEALER_CODE:
+                    action = actions[DEALER_CODE.index(dc)]
+                    self.table[key, d] = pack(ACTION_LETTERS.index(action[0]),
+                        ACTION_LETTERS.index(action[-1].upper()))
+        self.flat = self.table.ravel()
+        self.entries = self.flat.tolist()
+
+    # return the player key of a hand state (pair: rank of a splittable pair)
+    def key(self, state, pair=-1):
+        return PAIR_KEY + pair if pair >= 0 else state
+
+    # return the packed entry of a player key and dealer state
+    def lookup(self, key, dealer):
+        return self.entries[key * NUM_STATES + dealer]
+
+    #
+    # Returns the action (index into ACTION_LETTERS) for one hand
+    #
+    # state, dealer: player and dealer hand states
+    # pair: rank of a pair the player may split (-1 if none)
+    # can_double, can_surrender: whether the actions are allowed
+    #
+    def action(self, state, dealer, pair=-1, can_double=True, can_surrender=True):
+        entry = self.entries[(PAIR_KEY + pair if pair >= 0 else state) *
+            NUM_STATES + dealer]
+        play = entry & 15
+        if (play == DOUBLE and not can_double) or \
+                (play == SURRENDER and not can_surrender):
+            return entry >> 4
+        return play
+
+    #
+    # Returns the packed entries of a batch of hands
+    #
+    # states, dealers: arrays of player and dealer hand states
+    # pairs: array of pair ranks the player may split (-1 if none), or None
+    #
+    def lookup_batch(self, states, dealers, pairs=None):
+        keys = np.asarray(states, dtype=np.intp)
+        if pairs is not None:
+            pairs = np.asarray(pairs)
+            keys = np.where(pairs >= 0, PAIR_KEY + pairs, keys)
+        return self.flat[keys * NUM_STATES + np.asarray(dealers, dtype=np.intp)]
+
+    #
+    # Returns the actions of a batch of hands (see action())
+    #
+    # can_double, can_surrender: booleans or boolean arrays
+    #
+    def actions(self, states, dealers, pairs=None, can_double=True,
+            can_surrender=True):
+        entry = self.lookup_batch(states, dealers, pairs)
+        play = entry & 15
+        blocked = ((play == DOUBLE) & ~np.asarray(can_double)) | \
+            ((play == SURRENDER) & ~np.asarray(can_surrender))
+        return np.where(blocked, entry >> 4, play)
+
+    #
+    # Returns the actions of a batch of initial hands given by their cards
+    #
+    # player, dealer: integer arrays (hands, cards) of rank indices (see
+    #                 hand_states())
+    # can_split: whether a two card pair may be split
+    #
+    def actions_for_cards(self, player, dealer, can_split=True,
+            can_double=True, can_surrender=True):
+        player = np.asarray(player)
+        pairs = None
+        if can_split and player.shape[1] >= 2:
+            two = player[:, 1] >= 0
+            if player.shape[1] > 2:
+                two &= player[:, 2] < 0
+            pairs = np.where(two & (player[:, 0] == player[:, 1]), player[:, 0], -1)
+        return self.actions(hand_states(player), hand_states(dealer), pairs,
+            can_double, can_surrender)
+
+# return the letters of an array of actions
+def action_letters(actions):
+    return np.array(list(ACTION_LETTERS))[actions]
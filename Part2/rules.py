@@ -0,0 +1,25 @@
+#!/usr/bin/python3
+#
+# rules.py
+#
+# Rule set of a game of Easy Blackjack
+#
+
+from collections import namedtuple
+
+#
+# Immutable (and hashable) set of table rules. The defaults are the game
+# the calculator was written for.
+#
+# hit_soft17: dealer hits soft 17 (H17) instead of standing (S17)
+# blackjack_pays: payout of a player blackjack (1.5 is 3:2)
+# surrender: player may give up half the bet instead of playing
+# max_splits: number of times a hand may be split (1 or more, None for no
+#             limit)
+# double_after_split: player may double a hand made by splitting
+# hit_split_aces: split aces are played out instead of getting one card
+# decks: number of decks in the shoe (None for an infinite deck)
+#
+Rules = namedtuple('Rules', [ 'hit_soft17', 'blackjack_pays', 'surrender',
+    'max_splits', 'double_after_split', 'hit_split_aces', 'decks' ],
+    defaults=[ True, 1.5, True, 3, True, False, None ])
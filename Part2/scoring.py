@@ -0,0 +1,282 @@
+#!/usr/bin/python3
+#
+# scoring.py
+#
+# Score logged decisions against the calculated EVs: for every decision
+# the optimal action, the EV of the action taken and of the optimal one,
+# and the EV lost
+#
+# Example:
+#   python3 scoring.py decisions.csv --output scores.csv --workers 4
+#
+# A log holds one decision per line as "player cards,dealer cards,action",
+# eg "T6,T7,H", with the cards as in a shoe file (A, 2-9, T, J, Q, K) and
+# the action one of ACTION_LETTERS. Both dealer cards are shown in this
+# game, so a decision needs the two of them. A line that is not a decision
+# (a header, a blackjack or busted hand, an unknown action) is not scored.
+#
+# The log is read in chunks of whole lines, each parsed and scored as
+# NumPy arrays in a worker process, with a bounded number of chunks in
+# flight so files of any size score in constant memory. The scores file
+# holds "optimal action,taken EV,optimal EV,EV loss" for every line of the
+# log in order, with empty fields for a line that is not scored.
+#
+
+import argparse
+import collections
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import easybj
+from easybj import (NUM_STATES, DEALER_CODE, DISTINCT, PLAYER_STATE_CODE,
+    DEALER_STATE_CODE, hand_state)
+from lookup import (STAND, HIT, DOUBLE, SPLIT, SURRENDER, ACTION_LETTERS,
+    PAIR_KEY, NUM_KEYS, hand_states)
+from replay import CARD_RANK
+from rules import Rules
+from sweep import RULE_TYPES
+
+# bytes of a log read into one chunk (rounded up to a whole line)
+CHUNK_SIZE = 1 << 22
+
+# most cards a hand can hold before it is bust
+MAX_CARDS = 11
+
+# action index of every byte (-1 for bytes that are not actions)
+ACTION_INDEX = np.full(256, -1, dtype=np.int8)
+for _k, _c in enumerate(ACTION_LETTERS):
+    ACTION_INDEX[ord(_c)] = _k
+
+#
+# EVs of every action compiled into one array indexed by (player key,
+# dealer state, action), with the player keys of lookup.py (NaN where an
+# action has no EV)
+#
+# results: calculate() results
+# rules: rules of the results (for whether surrender is allowed)
+#
+class EVLookup:
+    def __init__(self, results, rules):
+        self.table = np.full((NUM_KEYS, NUM_STATES, len(ACTION_LETTERS)), np.nan)
+        # every dealer state of a dealer code (eg a soft 18 plays as 18)
+        dealers = [ s for s, d in enumerate(DEALER_STATE_CODE) if d in DEALER_CODE ]
+        columns = [ DEALER_CODE.index(DEALER_STATE_CODE[s]) for s in dealers ]
+
+        # a pair is played as its total when it is not split
+        pairs = [ hand_state(c * 2) for c in DISTINCT ]
+        codes = PLAYER_STATE_CODE + [ PLAYER_STATE_CODE[s] for s in pairs ]
+        for action, name in ((STAND, 'stand'), (HIT, 'hit'), (DOUBLE, 'double')):
+            table = results[name]
+            keys = [ k for k, c in enumerate(codes) if c in table.yindex ]
+            self.table[np.ix_(keys, dealers, [ action ])] = \
+                table.rows([ codes[k] for k in keys ])[:, columns, None]
+        self.table[np.ix_(PAIR_KEY + np.arange(len(DISTINCT)), dealers, [ SPLIT ])] = \
+            results['split'].rows([ c * 2 for c in DISTINCT ])[:, columns, None]
+        if rules.surrender:
+            self.table[:, dealers, SURRENDER] = np.where(
+                np.isnan(self.table[:, dealers, STAND]), np.nan, -0.5)
+
+    #
+    # Returns the EV of every action of a batch of hands as an array
+    # (hands, action), NaN where the action is not allowed
+    #
+    # player, dealer: integer arrays (hands, cards) of rank indices (see
+    #                 lookup.hand_states())
+    #
+    # Only two card hands may double, split (a pair) or surrender, and a
+    # blackjack has no action.
+    #
+    def values(self, player, dealer):
+        player = np.asarray(player)
+        two = (player >= 0).sum(axis=1) == 2
+        states = hand_states(player)
+        keys = states.astype(np.intp)
+        pair = two & (player[:, 0] == player[:, 1])
+        keys[pair] = PAIR_KEY + player[pair, 0]
+        values = self.table[keys, hand_states(dealer)]
+        values[~two, DOUBLE:] = np.nan
+        values[two & (states == 21)] = np.nan
+        return values
+
+#
+# Scores a batch of decisions and returns a dict of arrays: the optimal
+# action ('optimal', -1 where not scored), the EV of the action taken
+# ('taken_ev') and of the optimal one ('optimal_ev') and the EV lost
+# ('loss'), NaN where not scored
+#
+# evs: EVLookup
+# player, dealer: integer arrays (hands, cards) of rank indices
+# actions: integer array of the actions taken (indices into ACTION_LETTERS,
+#          -1 for none)
+#
+def score(evs, player, dealer, actions):
+    dealer = np.asarray(dealer)
+    actions = np.asarray(actions)
+    values = evs.values(player, dealer)
+    # a decision needs both dealer cards
+    values[(dealer >= 0).sum(axis=1) != 2] = np.nan
+
+    scored = ~np.isnan(values).all(axis=1)
+    optimal = np.full(len(values), -1)
+    optimal[scored] = np.nanargmax(values[scored], axis=1)
+    optimal_ev = np.where(scored, values[np.arange(len(values)), optimal], np.nan)
+    taken_ev = np.where(actions >= 0, values[np.arange(len(values)),
+        np.maximum(actions, 0)], np.nan)
+    return {
+        'optimal': np.where(np.isnan(taken_ev), -1, optimal),
+        'taken_ev': taken_ev,
+        'optimal_ev': np.where(np.isnan(taken_ev), np.nan, optimal_ev),
+        'loss': optimal_ev - taken_ev,
+    }
+
+#
+# Parses the lines of a log chunk and returns (player, dealer, actions) as
+# the arrays score() takes, one row per line. A chunk must end with a
+# newline.
+#
+def parse_log(data):
+    data = np.frombuffer(data, dtype=np.uint8)
+    newline = data == ord('\n')
+    line = np.cumsum(newline) - newline
+    lines = int(newline.sum())
+
+    # field of every byte: the commas before it on its line
+    comma = np.cumsum(data == ord(',')) - (data == ord(','))
+    starts = np.concatenate(([ 0 ], np.flatnonzero(newline)[:-1] + 1))
+    field = comma - comma[starts][line]
+
+    # cards of the player (field 0) and dealer (field 1), each placed at
+    # its position in its hand
+    ranks = CARD_RANK[data]
+    at = np.flatnonzero((ranks >= 0) & (field < 2))
+    group = line[at] * 2 + field[at]
+    first = np.concatenate(([ True ], group[1:] != group[:-1]))
+    position = np.arange(len(at)) - np.flatnonzero(first)[np.cumsum(first) - 1]
+    hands = np.full((lines, 2, MAX_CARDS + 1), -1, dtype=np.int8)
+    keep = position <= MAX_CARDS
+    hands[line[at][keep], field[at][keep], position[keep]] = ranks[at][keep]
+
+    # the first action letter of field 2
+    actions = np.full(lines, -1, dtype=np.int8)
+    act = np.flatnonzero((ACTION_INDEX[data] >= 0) & (field == 2))
+    seen, index = np.unique(line[act], return_index=True)
+    actions[seen] = ACTION_INDEX[data[act[index]]]
+
+    # a hand of more cards than a hand can hold is not a decision
+    actions[hands[:, 0, MAX_CARDS] >= 0] = -1
+    return hands[:, 0, :MAX_CARDS], hands[:, 1, :MAX_CARDS], actions
+
+# return the lines of the scores file of a batch (see score())
+def format_scores(scores):
+    out = []
+    for o, t, e, l in zip(scores['optimal'].tolist(), scores['taken_ev'].tolist(),
+            scores['optimal_ev'].tolist(), scores['loss'].tolist()):
+        out.append(",,," if o < 0 else "%s,%r,%r,%r"%(ACTION_LETTERS[o], t, e, l))
+    return "\n".join(out) + "\n" if out else ""
+
+# parse and score one chunk and return (lines, scored, total loss, losing
+# decisions by action taken, lines of the scores file or None)
+def _score_chunk(args):
+    evs, data, write = args
+    player, dealer, actions = parse_log(data)
+    scores = score(evs, player, dealer, actions)
+    loss = scores['loss']
+    scored = ~np.isnan(loss)
+    losing = np.bincount(actions[scored & (loss > 0)], minlength=len(ACTION_LETTERS))
+    return (len(actions), int(scored.sum()), float(loss[scored].sum()),
+        losing.tolist(), format_scores(scores) if write else None)
+
+# yield the chunks of whole lines of a file (each ending with a newline)
+def read_chunks(path, chunk_size=CHUNK_SIZE):
+    with open(path, 'rb') as f:
+        while True:
+            data = f.read(chunk_size)
+            if not data:
+                return
+            data += f.readline()
+            yield data if data.endswith(b'\n') else data + b'\n'
+
+#
+# Scores every decision of a log file
+#
+# path: log file
+# rules: rules of the EVs to score against (default: Rules())
+# output: scores file to write (None for the summary only)
+# workers: number of worker processes (all cores if None, 1 scores in this
+#          process)
+# chunk_size: bytes read into a chunk
+#
+# Returns a dict with the lines read, the decisions scored, the total and
+# mean EV lost and the number of losing decisions by action taken.
+#
+def score_file(path, rules=None, output=None, workers=None, chunk_size=CHUNK_SIZE):
+    rules = Rules() if rules is None else rules
+    evs = EVLookup(easybj.calculate(rules), rules)
+    workers = workers or os.cpu_count() or 1
+    summary = { 'lines': 0, 'scored': 0, 'total_loss': 0.,
+        'losing': dict.fromkeys(ACTION_LETTERS, 0) }
+
+    def add(result, out):
+        lines, scored, loss, losing, text = result
+        summary['lines'] += lines
+        summary['scored'] += scored
+        summary['total_loss'] += loss
+        for a, n in zip(ACTION_LETTERS, losing):
+            summary['losing'][a] += n
+        if out is not None:
+            out.write(text)
+
+    out = None if output is None else open(output, 'w')
+    try:
+        tasks = ((evs, data, out is not None) for data in read_chunks(path, chunk_size))
+        if workers == 1:
+            for t in tasks:
+                add(_score_chunk(t), out)
+        else:
+            # keep a few chunks per worker in flight, written back in order
+            with ProcessPoolExecutor(workers) as pool:
+                pending = collections.deque()
+                for t in tasks:
+                    pending.append(pool.submit(_score_chunk, t))
+                    if len(pending) >= 2 * workers:
+                        add(pending.popleft().result(), out)
+                while pending:
+                    add(pending.popleft().result(), out)
+    finally:
+        if out is not None:
+            out.close()
+
+    summary['mean_loss'] = summary['total_loss'] / max(summary['scored'], 1)
+    return summary
+
+#
+# Parses command line, scores a log and prints the summary
+#
+def main(argv):
+    parser = argparse.ArgumentParser(prog=argv[0],
+        description="Score logged decisions against the calculated EVs.")
+    parser.add_argument('log', help="decision log (player,dealer,action lines)")
+    parser.add_argument('--output', default=None, help="scores file to write")
+    parser.add_argument('--workers', type=int, default=None,
+        help="worker processes (default: all cores)")
+    parser.add_argument('--chunk_size', type=int, default=CHUNK_SIZE,
+        help="bytes read at a time")
+    for name in Rules._fields:
+        parser.add_argument('--' + name, type=RULE_TYPES[name],
+            default=Rules._field_defaults[name])
+    args = parser.parse_args(argv[1:])
+
+    rules = Rules(**{ name: getattr(args, name) for name in Rules._fields })
+    summary = score_file(args.log, rules, args.output, args.workers, args.chunk_size)
+    print("Lines: %d  Decisions Scored: %d"%(summary['lines'], summary['scored']))
+    print("EV Lost: %.4f units (%.6f per decision)"%(summary['total_loss'],
+        summary['mean_loss']))
+    print("Losing Decisions by Action Taken: " + " ".join("%s: %d"%(a, n)
+        for a, n in summary['losing'].items()))
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,234 @@
+#!/usr/bin/python3
+#
+# server.py
+#
+# Local calculation service: one process keeps the results of
+# easybj.calculate() for all the tools on a box, so the same rule set is
+# only calculated once
+#
+# Example:
+#   python3 server.py --socket /tmp/easybj.sock
+#   python3 server.py --port 8765 --workers 4 --cache_mb 256
+#
+# The protocol is one JSON object per line each way. A request is
+#   {"rules": {...}, "decks": n, "counts": [...], "prob": [...],
+#    "results": ["advantage", "strategy", ...]}
+# where every field is optional and means what the argument of the same
+# name means to calculate() (results: the results to return, all by
+# default). The response holds each result as export.result_json() writes
+# it, or {"error": message}. {"op": "stats"} returns the counters of the
+# service.
+#
+# Calculations run on a process pool and come back encoded, so the event
+# loop only joins strings. Concurrent requests for the same rule set share
+# one calculation, and encoded results are kept in a least recently used
+# cache bounded by its size in bytes.
+#
+
+import argparse
+import asyncio
+import collections
+import json
+import os
+import socket
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import easybj
+from export import result_json
+from rules import Rules
+
+# default bound of the result cache in bytes
+CACHE_BYTES = 64 << 20
+
+# longest request line read
+MAX_LINE = 1 << 20
+
+# connections waiting to be accepted
+BACKLOG = 1024
+
+# return the key of a request: the arguments of calculate() it names
+def request_key(request):
+    rules = Rules(**request.get('rules', {}))
+    if request.get('decks') is not None:
+        rules = rules._replace(decks=int(request['decks']))
+    counts = request.get('counts')
+    if counts is not None:
+        counts = tuple(int(c) for c in counts)
+    prob = request.get('prob')
+    if prob is not None:
+        prob = easybj.rank_probabilities(prob)
+    return rules, counts, prob
+
+# calculate the results of a key and return each encoded as JSON (runs in
+# a worker process). The calculator is built directly rather than through
+# calculate(), whose cache of whole results would grow in every worker
+# outside the byte bound of the service's own cache.
+def _calculate(key):
+    rules, counts, prob = key
+    results = easybj.Results(easybj.make_calculator(rules, counts, prob=prob))
+    return { name: json.dumps(result_json(value)) for name, value in results.items() }
+
+#
+# Least recently used cache of encoded results bounded by their size
+#
+class ResultCache:
+    def __init__(self, max_bytes=CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = collections.OrderedDict()
+        self.bytes = 0
+
+    # return the entry of a key (None if not cached), marking it as used
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+        return entry
+
+    # add an entry and evict the least recently used ones over the bound
+    def put(self, key, entry):
+        size = sum(len(v) for v in entry.values())
+        if size > self.max_bytes:
+            return
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.bytes -= sum(len(v) for v in old.values())
+        self.entries[key] = entry
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.bytes -= sum(len(v) for v in evicted.values())
+
+#
+# The service: answers requests from the cache, or from a calculation
+# shared by every request for the same key
+#
+# workers: worker processes (all cores if None)
+# cache_bytes: bound of the result cache in bytes
+#
+class CalculationService:
+    def __init__(self, workers=None, cache_bytes=CACHE_BYTES):
+        self.pool = ProcessPoolExecutor(workers or os.cpu_count() or 1)
+        self.cache = ResultCache(cache_bytes)
+        self.pending = {}
+        self.stats = { 'requests': 0, 'hits': 0, 'calculations': 0,
+            'coalesced': 0, 'errors': 0 }
+
+    # return the encoded results of a key
+    async def results(self, key):
+        entry = self.cache.get(key)
+        if entry is not None:
+            self.stats['hits'] += 1
+            return entry
+        future = self.pending.get(key)
+        if future is not None:
+            self.stats['coalesced'] += 1
+            return await asyncio.shield(future)
+
+        self.stats['calculations'] += 1
+        future = asyncio.get_running_loop().run_in_executor(self.pool, _calculate, key)
+        self.pending[key] = future
+        future.add_done_callback(lambda f: self._finish(key, f))
+        # a client that goes away must not cancel the calculation of the rest
+        return await asyncio.shield(future)
+
+    # cache the results of a finished calculation (not an error)
+    def _finish(self, key, future):
+        del self.pending[key]
+        if not future.cancelled() and future.exception() is None:
+            self.cache.put(key, future.result())
+
+    # return the response line of a request line
+    async def respond(self, line):
+        self.stats['requests'] += 1
+        try:
+            request = json.loads(line)
+            if request.get('op') == 'stats':
+                return json.dumps(dict(self.stats, entries=len(self.cache.entries),
+                    bytes=self.cache.bytes))
+            names = request.get('results') or list(easybj.RESULTS)
+            for name in names:
+                if name not in easybj.RESULTS:
+                    raise KeyError("unknown result %s"%name)
+            entry = await self.results(request_key(request))
+        except Exception as e:
+            self.stats['errors'] += 1
+            return json.dumps({ 'error': "%s: %s"%(type(e).__name__, e) })
+        return "{" + ", ".join("%s: %s"%(json.dumps(n), entry[n]) for n in names) + "}"
+
+    # answer the request lines of one client in order
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # a line over the stream limit
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                writer.write((await self.respond(line)).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    # start serving on a unix socket path or a local TCP port
+    async def start(self, path=None, port=None, host='127.0.0.1'):
+        if path is not None:
+            return await asyncio.start_unix_server(self.handle, path,
+                limit=MAX_LINE, backlog=BACKLOG)
+        return await asyncio.start_server(self.handle, host, port,
+            limit=MAX_LINE, backlog=BACKLOG)
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+
+#
+# Sends one request to a running service and returns its response
+#
+# address: unix socket path, or (host, port)
+#
+def request(address, message):
+    family = socket.AF_UNIX if isinstance(address, str) else socket.AF_INET
+    with socket.socket(family, socket.SOCK_STREAM) as s:
+        s.connect(address)
+        s.sendall(json.dumps(message).encode() + b"\n")
+        with s.makefile('rb') as f:
+            return json.loads(f.readline())
+
+#
+# Parses command line and serves until interrupted
+#
+def main(argv):
+    parser = argparse.ArgumentParser(prog=argv[0],
+        description="Serve calculated results on a local socket.")
+    where = parser.add_mutually_exclusive_group(required=True)
+    where.add_argument('--socket', help="unix socket path")
+    where.add_argument('--port', type=int, help="TCP port on 127.0.0.1")
+    parser.add_argument('--workers', type=int, default=None,
+        help="worker processes (default: all cores)")
+    parser.add_argument('--cache_mb', type=float, default=CACHE_BYTES / (1 << 20),
+        help="bound of the result cache in MB (default: %d)"%(CACHE_BYTES >> 20))
+    args = parser.parse_args(argv[1:])
+
+    async def serve():
+        service = CalculationService(args.workers, int(args.cache_mb * (1 << 20)))
+        server = await service.start(args.socket, args.port)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            service.close()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main(sys.argv)
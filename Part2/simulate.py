@@ -0,0 +1,265 @@
+#!/usr/bin/python3
+#
+# simulate.py
+#
+# Monte Carlo check of the calculated advantage: play the strategy table
+# over many rounds and report the mean return with its spread
+#
+# Example:
+#   python3 simulate.py --hands 10000000 --seed 1
+#
+# Rounds are played in batches where every round of the batch is advanced
+# in lockstep as NumPy arrays. Batches are spread over worker processes,
+# each with its own random stream spawned from one seed, so a run is
+# reproducible for a given seed and batch size whatever the worker count.
+#
+
+import argparse
+import math
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import easybj
+from easybj import (BUST, EMPTY, NUM_STATES, DISTINCT, state_total,
+    dealer_stand_list, probability, shoe_counts)
+from lookup import NEXT, HIT, DOUBLE, SPLIT, SURRENDER, StrategyLookup
+from rules import Rules
+from sweep import RULE_TYPES
+
+# total of every state (0 for a bust)
+TOTAL = np.array([ state_total(s) for s in range(NUM_STATES) ], dtype=np.int8)
+
+# splits played when the rules set no limit (more splits in one round are
+# too rare to change the result)
+UNLIMITED_SPLITS = 15
+
+# the state of a hand holding a single card of each rank
+ONE_CARD = NEXT[EMPTY]
+
+#
+# Deals cards for a batch of rounds, from an infinite deck or from a fresh
+# shoe for every round
+#
+class Dealer:
+    def __init__(self, rng, rounds, counts=None):
+        self.rng = rng
+        if counts is None:
+            self.cumprob = np.cumsum([ probability(c) for c in DISTINCT ])
+            self.shoe = None
+        else:
+            self.shoe = np.tile(np.array(counts, dtype=np.int32), (rounds, 1))
+
+    # draw one card for each of the given rounds, returning its rank index
+    def draw(self, rounds):
+        if self.shoe is None:
+            cards = np.searchsorted(self.cumprob, self.rng.random(len(rounds)) *
+                self.cumprob[-1], side='right')
+            return np.minimum(cards, len(DISTINCT) - 1)
+        shoe = self.shoe[rounds]
+        cum = shoe.cumsum(axis=1)
+        pick = self.rng.integers(0, cum[:, -1])
+        cards = (cum <= pick[:, None]).sum(axis=1)
+        self.shoe[rounds, cards] -= 1
+        return cards
+
+#
+# Plays a batch of rounds and returns the net units won in each round
+#
+# strategy: StrategyLookup of the strategy to play
+# rules: game rules
+# rng: numpy random generator
+# rounds: number of rounds
+# counts: cards of each rank in the shoe (None for an infinite deck)
+#
+def play_rounds(strategy, rules, rng, rounds, counts=None):
+    slots = (rules.max_splits or UNLIMITED_SPLITS) + 1
+    dealer = Dealer(rng, rounds, counts)
+    every = np.arange(rounds)
+
+    # deal dealer then player cards
+    d1, d2 = dealer.draw(every), dealer.draw(every)
+    p1, p2 = dealer.draw(every), dealer.draw(every)
+    dstate = NEXT[ONE_CARD[d1], d2]
+
+    state = np.zeros((rounds, slots), dtype=np.int8)
+    ncards = np.zeros((rounds, slots), dtype=np.int8)
+    first = np.zeros((rounds, slots), dtype=np.int8)
+    pair = np.zeros((rounds, slots), dtype=bool)
+    bet = np.ones((rounds, slots))
+    state[:, 0] = NEXT[ONE_CARD[p1], p2]
+    ncards[:, 0] = 2
+    first[:, 0] = p1
+    pair[:, 0] = p1 == p2
+    hands = np.ones(rounds, dtype=np.int8)
+    surrendered = np.zeros(rounds, dtype=bool)
+    split_aces = np.zeros(rounds, dtype=bool)
+
+    # blackjacks settle the round before any play
+    dealer_bj = dstate == 21
+    player_bj = state[:, 0] == 21
+    natural = dealer_bj | player_bj
+
+    # play the hands of every round slot by slot (a split adds a slot)
+    for h in range(slots):
+        cur = np.flatnonzero((hands > h) & ~natural)
+        while cur.size:
+            # a hand left with one card by a split draws its second card
+            one = ncards[cur, h] == 1
+            if one.any():
+                r = cur[one]
+                card = dealer.draw(r)
+                state[r, h] = NEXT[state[r, h], card]
+                ncards[r, h] = 2
+                pair[r, h] = card == first[r, h]
+
+            # 21, busts and split aces taking one card are done
+            s = state[cur, h]
+            done = (s == BUST) | (s == 21)
+            if not rules.hit_split_aces:
+                done |= split_aces[cur]
+            cur = cur[~done]
+            if not cur.size:
+                break
+            s = state[cur, h]
+            two = ncards[cur, h] == 2
+            split = hands[cur] > 1
+
+            # aces are never resplit
+            can_split = pair[cur, h] & two & (hands[cur] < slots) & ~split_aces[cur]
+            can_double = two & (~split | rules.double_after_split)
+            can_surrender = two & ~split & rules.surrender
+            action = strategy.actions(s, dstate[cur],
+                np.where(can_split, first[cur, h], -1), can_double, can_surrender)
+
+            r = cur[action == SURRENDER]
+            surrendered[r] = True
+
+            r = cur[action == DOUBLE]
+            bet[r, h] = 2.
+            state[r, h] = NEXT[state[r, h], dealer.draw(r)]
+
+            r = cur[action == HIT]
+            state[r, h] = NEXT[state[r, h], dealer.draw(r)]
+            ncards[r, h] += 1
+
+            # a split moves the second card to a new hand of one card
+            r = cur[action == SPLIT]
+            k = hands[r]
+            card = first[r, h]
+            state[r, h] = ONE_CARD[card]
+            state[r, k] = ONE_CARD[card]
+            ncards[r, h] = ncards[r, k] = 1
+            first[r, k] = card
+            hands[r] += 1
+            split_aces[r] |= card == 0
+
+            cur = cur[(action == HIT) | (action == SPLIT)]
+
+    # the dealer draws to a standing total
+    stands = np.array(dealer_stand_list(rules.hit_soft17))
+    cur = np.flatnonzero(~natural & ~stands[dstate])
+    while cur.size:
+        dstate[cur] = NEXT[dstate[cur], dealer.draw(cur)]
+        cur = cur[~stands[dstate[cur]]]
+
+    # settle every hand against the dealer total (a busted hand loses even
+    # if the dealer busts)
+    ptotal = TOTAL[state].astype(np.int16)
+    dtotal = TOTAL[dstate].astype(np.int16)[:, None]
+    sign = np.where(state == BUST, -1, np.sign(ptotal - dtotal))
+    played = np.arange(slots) < hands[:, None]
+    result = (sign * bet * played).sum(axis=1)
+
+    result[surrendered] = -0.5
+    result[player_bj] = rules.blackjack_pays
+    result[dealer_bj] = np.where(player_bj[dealer_bj], 0., -1.)
+    return result
+
+# play one batch of rounds and return (rounds, sum, sum of squares)
+def _simulate_batch(args):
+    strategy, rules, seed, rounds, counts = args
+    result = play_rounds(strategy, rules, np.random.default_rng(seed),
+        rounds, counts)
+    return rounds, float(result.sum()), float(np.square(result).sum())
+
+#
+# Plays the strategy over many rounds and returns the simulated return
+#
+# rules: game rules (default: Rules())
+# hands: number of rounds to play
+# strategy: strategy Table to play (default: the calculated strategy)
+# workers: number of worker processes (all cores if None, 1 plays in this
+#          process)
+# seed: seed of the random streams (None for a fresh seed)
+# batch: rounds played in lockstep per task
+#
+# Returns a dict with the rounds played, the mean and standard deviation
+# of the net units won per round, the standard error of the mean and its
+# 95% confidence interval.
+#
+def simulate(rules=None, hands=1000000, strategy=None, workers=None, seed=None,
+        batch=100000):
+    rules = Rules() if rules is None else rules
+    if strategy is None:
+        strategy = easybj.calculate(rules)['strategy']
+    strategy = StrategyLookup(strategy)
+    counts = None if rules.decks is None else shoe_counts(rules.decks)
+
+    sizes = [ batch ] * (hands // batch) + ([ hands % batch ] if hands % batch else [])
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = [ (strategy, rules, s, n, counts) for s, n in zip(seeds, sizes) ]
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        totals = [ _simulate_batch(t) for t in tasks ]
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            totals = list(pool.map(_simulate_batch, tasks))
+
+    n = sum(t[0] for t in totals)
+    mean = sum(t[1] for t in totals) / n
+    var = max(sum(t[2] for t in totals) / n - mean * mean, 0.) * n / max(n - 1, 1)
+    std = math.sqrt(var)
+    stderr = std / math.sqrt(n)
+    return {
+        'hands': n,
+        'mean': mean,
+        'std': std,
+        'stderr': stderr,
+        'ci95': (mean - 1.96 * stderr, mean + 1.96 * stderr),
+    }
+
+#
+# Parses command line, runs the simulation and prints it next to the
+# calculated advantage
+#
+def main(argv):
+    parser = argparse.ArgumentParser(prog=argv[0],
+        description="Simulate the calculated strategy.")
+    parser.add_argument('--hands', type=int, default=1000000)
+    parser.add_argument('--workers', type=int, default=None,
+        help="worker processes (default: all cores)")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--batch', type=int, default=100000,
+        help="rounds played in lockstep per task")
+    for name in Rules._fields:
+        parser.add_argument('--' + name, type=RULE_TYPES[name],
+            default=Rules._field_defaults[name])
+    args = parser.parse_args(argv[1:])
+
+    rules = Rules(**{ name: getattr(args, name) for name in Rules._fields })
+    result = simulate(rules, args.hands, workers=args.workers, seed=args.seed,
+        batch=args.batch)
+    print("Calculated Advantage: %2.4f%%"%(easybj.calculate(rules)['advantage']*100))
+    print("Simulated Return:     %2.4f%% +/- %.4f%% (95%% CI %2.4f%% to %2.4f%%)"%(
+        result['mean']*100, 1.96*result['stderr']*100,
+        result['ci95'][0]*100, result['ci95'][1]*100))
+    print("Standard Deviation:   %.4f units over %d hands"%(result['std'],
+        result['hands']))
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,162 @@
+#!/usr/bin/python3
+#
+# sweep.py
+#
+# Evaluate the player advantage and strategy over a grid of rule sets in
+# parallel, streaming one JSON record per rule set to a results file
+#
+# Example:
+#   python3 sweep.py results.jsonl --hit_soft17 1 0 --blackjack_pays 1.5 1.2
+#
+# Each line of the results file holds {"rules", "advantage", "strategy"},
+# where strategy maps each player code to its actions in DEALER_CODE order.
+# Rerunning the same command after an interruption only evaluates the rule
+# sets missing from the file.
+#
+
+import argparse
+import itertools
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import easybj
+from rules import Rules
+
+#
+# Returns every rule set in the grid of the given rule values
+#
+# values: dict of Rules field name to a list of values for that field
+#         (fields left out keep their default)
+#
+def rule_grid(values):
+    for name in values:
+        if name not in Rules._fields:
+            raise KeyError("%s is not a rule"%name)
+    names = list(values)
+    return [ Rules(**dict(zip(names, combo)))
+        for combo in itertools.product(*[ values[n] for n in names ]) ]
+
+# return the JSON record of one evaluated rule set
+def make_record(rules, results):
+    strategy = results['strategy']
+    return {
+        'rules': rules._asdict(),
+        'advantage': results['advantage'],
+        'strategy': { p: strategy.row(p) for p in strategy.ylabels },
+    }
+
+# evaluate a chunk of rule sets (runs in a worker process)
+def _evaluate_chunk(chunk):
+    return [ make_record(rules, easybj.calculate(rules)) for rules in chunk ]
+
+#
+# Returns the rule sets already in a results file. A partly written last
+# line (left by an interruption) is cut off so new records can be appended.
+#
+def load_done(path):
+    done = set()
+    if not os.path.exists(path):
+        return done
+
+    with open(path, 'r+b') as f:
+        good = 0
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            if not line.endswith(b'\n'):
+                break
+            done.add(Rules(**record['rules']))
+            good += len(line)
+        f.truncate(good)
+    return done
+
+#
+# Evaluates every rule set not yet in the results file
+#
+# grid: list of Rules to evaluate
+# path: results file (JSON lines), appended to as chunks finish
+# workers: number of worker processes (all cores if None)
+# chunksize: rule sets evaluated per task (picked from the grid size if None)
+#
+# Returns the number of rule sets evaluated.
+#
+def sweep(grid, path, workers=None, chunksize=None):
+    done = load_done(path)
+    todo = [ rules for rules in dict.fromkeys(grid) if rules not in done ]
+    if not todo:
+        return 0
+
+    workers = workers or os.cpu_count() or 1
+    if chunksize is None:
+        # a few chunks per worker keeps every core busy to the end
+        chunksize = max(1, len(todo) // (workers * 4))
+    chunks = [ todo[i:i+chunksize] for i in range(0, len(todo), chunksize) ]
+
+    with open(path, 'a') as out, ProcessPoolExecutor(workers) as pool:
+        futures = [ pool.submit(_evaluate_chunk, chunk) for chunk in chunks ]
+        for future in as_completed(futures):
+            for record in future.result():
+                out.write(json.dumps(record) + '\n')
+            out.flush()
+    return len(todo)
+
+# parse a boolean rule value
+def _boolean(text):
+    if text.lower() in ('1', 'true', 'yes', 'y'):
+        return True
+    if text.lower() in ('0', 'false', 'no', 'n'):
+        return False
+    raise argparse.ArgumentTypeError("%s is not a boolean"%text)
+
+# parse a deck count (none or inf for an infinite deck)
+def _decks(text):
+    if text.lower() in ('none', 'inf'):
+        return None
+    return int(text)
+
+# parse a split limit (none or inf for no limit)
+def _splits(text):
+    if text.lower() in ('none', 'inf'):
+        return None
+    return int(text)
+
+# parser of each rule value
+RULE_TYPES = {
+    'hit_soft17': _boolean,
+    'blackjack_pays': float,
+    'surrender': _boolean,
+    'max_splits': _splits,
+    'double_after_split': _boolean,
+    'hit_split_aces': _boolean,
+    'decks': _decks,
+}
+
+#
+# Parses command line and runs the sweep
+#
+def main(argv):
+    parser = argparse.ArgumentParser(prog=argv[0],
+        description="Evaluate a grid of rule sets in parallel.")
+    parser.add_argument('output', help="results file (JSON lines)")
+    parser.add_argument('--workers', type=int, default=None,
+        help="worker processes (default: all cores)")
+    parser.add_argument('--chunksize', type=int, default=None,
+        help="rule sets per task")
+    for name in Rules._fields:
+        parser.add_argument('--' + name, nargs='+', type=RULE_TYPES[name],
+            help="values of %s (default: %s)"%(name, Rules._field_defaults[name]))
+    args = parser.parse_args(argv[1:])
+
+    values = { name: getattr(args, name) for name in Rules._fields
+        if getattr(args, name) is not None }
+    grid = rule_grid(values)
+    count = sweep(grid, args.output, args.workers, args.chunksize)
+    print("%d of %d rule set(s) evaluated"%(count, len(grid)))
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -4,10 +4,23 @@
 #
 # Implements a two-dimension table where all cells must be of same type
 #
- 
+# Float tables are stored as a dense float64 array (NaN marks an empty
+# cell). Tables of any other type store small integer indices into a pool
+# of the distinct values seen so far (-1 marks an empty cell).
+#
+
 from collections.abc import Sized
- 
+import numpy as np
+
+# marks an empty cell in a table that is not of type float
+EMPTY_INDEX = -1
+
 class Table:
+   # number of cell reads and writes through the index operators (read by
+   # the calculator instrumentation)
+    reads = 0
+    writes = 0
+
    #
    # Initializes an instance of Table class
    #
@@ -23,11 +36,21 @@ class Table:
        self.xlabels = tuple(xlabels)
        self.ylabels = tuple(ylabels)
        self.unit = unit
- 
-       self.table = [[None for j in range(24)] for i in range(35)] 
-       # TODO: finish me
+
+       # label to array index
+       self.xindex = { x: i for i, x in enumerate(self.xlabels) }
+       self.yindex = { y: i for i, y in enumerate(self.ylabels) }
+
+       shape = (len(self.ylabels), len(self.xlabels))
+       if celltype is float:
+           self.table = np.full(shape, np.nan)
+       else:
+           self.table = np.full(shape, EMPTY_INDEX, dtype=np.int16)
+           # pool of distinct cell values and their index in the pool
+           self.values = []
+           self.value_index = {}
        return
-  
+
    #
    # "private" member function to validate key
    #
@@ -37,62 +60,163 @@ class Table:
        if len(key) != 2:
            raise KeyError("key must have exactly two elements")
        # unpack key to row and column
-       row, col = key   
-       if row not in self.ylabels:
+       row, col = key
+       try:
+           i = self.yindex.get(row)
+           j = self.xindex.get(col)
+       except TypeError:
+           raise KeyError("%s is not a hashable label"%str(key))
+       if i is None:
            raise KeyError("%s is not a valid y-label"%str(row))
-       if col not in self.xlabels:
+       if j is None:
            raise KeyError("%s is not a valid x-label"%str(col))
-       return row, col
-      
+       return i, j
+
+   #
+   # "private" member function to convert a cell value to its stored form
+   #
+    def _encode(self, value):
+       if self.celltype is float:
+           return value
+       index = self.value_index.get(value)
+       if index is None:
+           index = len(self.values)
+           self.values.append(value)
+           self.value_index[value] = index
+       return index
+
+   #
+   # "private" member function to convert a stored cell to its value
+   #
+    def _decode(self, cell):
+       if self.celltype is float:
+           return None if cell != cell else float(cell)
+       return None if cell == EMPTY_INDEX else self.values[cell]
+
    #
    # Overloads index operator for assigning to a cell
    #
    # key: key of the cell
    # value: value of the cell (must be of type 'celltype')
-   #   
+   #
     def __setitem__(self, key, value):
        if not isinstance(value, self.celltype):
            raise TypeError("value must be of type %s"%(self.celltype.__name__))
-       row, col = self._validate_key(key)
- 
-       self.table[self.ylabels.index(row)][self.xlabels.index(col)] = value
-      
-       return self.table[self.ylabels.index(row)][self.xlabels.index(col)]
- 
+       i, j = self._validate_key(key)
+       self.table[i, j] = self._encode(value)
+       Table.writes += 1
+       return value
+
    #
    # Overloads index operator for retrieving a value from a cell
    #
    # key: key of the cell
-   #   
+   #
     def __getitem__(self, key):
-       row, col = self._validate_key(key)
-      
-       # TODO: implement me
-       return self.table[self.ylabels.index(row)][self.xlabels.index(col)]
- 
+       i, j = self._validate_key(key)
+       Table.reads += 1
+       return self._decode(self.table[i, j])
+
    #
    # Overloads index operator for deleting a cell's value. You should
    # set the cell's value back to None
    #
    # key: key of the cell
-   # 
+   #
     def __delitem__(self, key):
-       row, col = self._validate_key(key)
-       self.table[self.ylabels.index(row)][self.xlabels.index(col)] = None
-       # TODO: implement me
+       i, j = self._validate_key(key)
+       self.table[i, j] = np.nan if self.celltype is float else EMPTY_INDEX
        return
 
+   #
+   # Returns the values of a whole row (float tables return a view of
+   # the underlying array, other tables return a list)
+   #
+    def row(self, y):
+       if y not in self.yindex:
+           raise KeyError("%s is not a valid y-label"%str(y))
+       return self._decode_array(self.table[self.yindex[y]])
+
+   #
+   # Returns the values of a whole column
+   #
+    def column(self, x):
+       if x not in self.xindex:
+           raise KeyError("%s is not a valid x-label"%str(x))
+       return self._decode_array(self.table[:, self.xindex[x]])
+
+   #
+   # Returns the rows for the given y-labels (in that order) as a 2D array
+   #
+    def rows(self, ylabels):
+       try:
+           index = [ self.yindex[y] for y in ylabels ]
+       except KeyError as e:
+           raise KeyError("%s is not a valid y-label"%str(e.args[0]))
+       return self.table[index]
+
+   #
+   # Assigns a whole row, a whole column or the whole table from a
+   # sequence or array of values
+   #
+    def set_row(self, y, values):
+       if y not in self.yindex:
+           raise KeyError("%s is not a valid y-label"%str(y))
+       self.table[self.yindex[y]] = self._encode_array(values)
+
+    def set_column(self, x, values):
+       if x not in self.xindex:
+           raise KeyError("%s is not a valid x-label"%str(x))
+       self.table[:, self.xindex[x]] = self._encode_array(values)
+
+    def fill(self, values):
+       values = self._encode_array(values)
+       if values.shape != self.table.shape:
+           raise ValueError("expected an array of shape %s"%str(self.table.shape))
+       self.table[:] = values
+
+   #
+   # Returns a new float table holding the elementwise max of the given
+   # tables, which must all share the same labels
+   #
+    @staticmethod
+    def maximum(*tables):
+       first = tables[0]
+       for t in tables:
+           if t.celltype is not float:
+               raise TypeError("maximum needs tables of type float")
+           if t.xlabels != first.xlabels or t.ylabels != first.ylabels:
+               raise KeyError("tables do not share the same labels")
+       result = Table(float, first.xlabels, first.ylabels, first.unit)
+       result.table[:] = np.maximum.reduce([ t.table for t in tables ])
+       return result
+
+   #
+   # "private" member functions to convert whole arrays of cells
+   #
+    def _encode_array(self, values):
+       if self.celltype is float:
+           return np.asarray(values, dtype=np.float64)
+       return np.array([ EMPTY_INDEX if v is None else self._encode(v)
+           for v in np.ravel(np.asarray(values, dtype=object)) ],
+           dtype=np.int16).reshape(np.shape(values))
+
+    def _decode_array(self, cells):
+       if self.celltype is float:
+           return cells
+       return [ self._decode(c) for c in cells ]
+
     def __str__(self):
         # column width
         colwidth = 6 if self.celltype is float else 2
-    
+
         # y-label width (for first column)
         ylwidth = max([len(str(y)) for y in self.ylabels])
-    
+
         # print title row (space delimited labels)
-        print(" ".join([ " "*ylwidth ] + 
+        print(" ".join([ " "*ylwidth ] +
             [ str(x)[:colwidth].center(colwidth) for x in self.xlabels ]))
-    
+
         # print each row from the table
         for y in self.ylabels:
             row = [ str(y).rjust(ylwidth) ]
@@ -111,7 +235,3 @@ class Table:
                 row.append(text)
             print(" ".join(row))
         return '\nEnd Table\n'
-  
- 
-
-
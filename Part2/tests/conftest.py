@@ -0,0 +1,11 @@
+#
+# conftest.py
+#
+# The modules of Part2 import each other by name, so the tests run with
+# Part2 on the path
+#
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
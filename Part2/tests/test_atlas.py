@@ -0,0 +1,64 @@
+#
+# test_atlas.py
+#
+# Checks of building an atlas file and reading it back
+#
+
+import numpy as np
+import pytest
+
+import easybj
+from easybj import rank_probabilities
+from atlas import Atlas, build, build_counts, play_indices
+from counting import true_count_weights
+
+COUNTS = [ 2, -1, 0, 1, -2 ]
+
+@pytest.fixture(scope='module')
+def path(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('atlas') / 'counts.atlas')
+    build_counts(path, COUNTS, workers=1)
+    return path
+
+def test_round_trip(path):
+    with Atlas(path) as atlas:
+        assert len(atlas) == len(COUNTS)
+        assert list(atlas.true_count) == COUNTS
+        for i, t in enumerate(COUNTS):
+            prob = rank_probabilities(true_count_weights(t))
+            calc = easybj.Calculator(prob=prob)
+            calc.run('advantage')
+            calc.run('strategy')
+            assert atlas.prob[i].tolist() == list(prob)
+            assert atlas.advantage[i] == calc.advantage
+            assert np.array_equal(atlas.optimal[i], calc.optimal_ev.table, equal_nan=True)
+            assert np.array_equal(atlas.strategy[i], play_indices(calc.strategy))
+            assert atlas.play(i, '16', '10') == calc.strategy['16', '10']
+            assert atlas.ev(i, '16', '10') == calc.optimal_ev['16', '10']
+
+def test_nearest_count(path):
+    with Atlas(path) as atlas:
+        def nearest(t):
+            return atlas.true_count[atlas.nearest_count(t)]
+        assert nearest(0.2) == 0 and nearest(0.8) == 1
+        # a tie goes to the lower count
+        assert nearest(0.5) == 0 and nearest(-1.5) == -2
+        # past either end
+        assert nearest(-100) == -2 and nearest(-2) == -2
+        assert nearest(100) == 2 and nearest(2) == 2
+
+def test_nearest_count_needs_counts(tmp_path):
+    path = str(tmp_path / 'shoes.atlas')
+    build(path, [ true_count_weights(0) ], workers=1)
+    with Atlas(path) as atlas:
+        with pytest.raises(ValueError):
+            atlas.nearest_count(0)
+
+def test_close_with_views_held(path):
+    atlas = Atlas(path)
+    strategy = atlas.strategy[0]
+    expected = strategy.copy()
+    atlas.close()
+    atlas.close()
+    assert atlas.map is None and not hasattr(atlas, 'strategy')
+    assert np.array_equal(strategy, expected)
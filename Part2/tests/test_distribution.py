@@ -0,0 +1,31 @@
+#
+# test_distribution.py
+#
+# Checks that the distribution of a round agrees with the calculated
+# advantage
+#
+
+import pytest
+
+import easybj
+from distribution import DistributionCalculator, UNLIMITED_UNITS, moments
+from rules import Rules
+
+# the mean of limited splits is exact, that of unlimited splits leaves out
+# the rounds past UNLIMITED_UNITS
+@pytest.mark.parametrize('rules, tol', [
+    (Rules(), 1e-14),
+    (Rules(max_splits=1, surrender=False), 1e-14),
+    (Rules(max_splits=None), 1e-10),
+])
+def test_mean_is_advantage(rules, tol):
+    units, probs = DistributionCalculator(rules).round()
+    mean, var, skew = moments(units, probs)
+    assert mean == pytest.approx(easybj.calculate(rules)['advantage'], abs=tol)
+    assert probs.sum() == pytest.approx(1., abs=1e-12)
+    assert (probs >= 0).all()
+    assert units.max() <= 2 * UNLIMITED_UNITS
+
+def test_needs_infinite_deck():
+    with pytest.raises(ValueError):
+        DistributionCalculator(Rules(decks=2))
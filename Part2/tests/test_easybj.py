@@ -0,0 +1,174 @@
+#
+# test_easybj.py
+#
+# Regression checks of the calculator against the tables of the original
+# implementation, and of the finite shoe and parallel calculators against
+# the infinite deck serial one
+#
+# baseline_default.json holds every result of the default rules as the
+# original calculator (before the state graph, the split solver and the
+# vectorized tables) made them: each table as {row: {column: cell}}, the
+# resplit levels as a list of tables, the dealer outcomes and the
+# advantage.
+#
+
+import json
+import math
+import os
+
+import numpy as np
+import pytest
+
+import easybj
+from easybj import DEALER_CODE, shoe_counts
+from rules import Rules
+
+# tolerance of a float cell (the rewrites add the same terms in another
+# order)
+TOLERANCE = 1e-9
+
+with open(os.path.join(os.path.dirname(__file__), 'baseline_default.json')) as f:
+    BASELINE = json.load(f)
+
+# check a table against its baseline cells
+def check_table(table, expected):
+    assert list(table.ylabels) == list(expected)
+    for y, row in expected.items():
+        assert list(table.xlabels) == list(row)
+        for x, v in row.items():
+            cell = table[y,x]
+            if v is None or isinstance(v, str):
+                assert cell == v, (y, x)
+            else:
+                assert cell == pytest.approx(v, abs=TOLERANCE), (y, x)
+
+@pytest.mark.parametrize('name', [ 'initial', 'stand', 'hit', 'double',
+    'split', 'optimal', 'strategy' ])
+def test_default_tables(name):
+    check_table(easybj.calculate(Rules())[name], BASELINE[name])
+
+def test_default_resplit_levels():
+    resplit = easybj.calculate(Rules())['resplit']
+    assert len(resplit) == len(BASELINE['resplit'])
+    for table, expected in zip(resplit, BASELINE['resplit']):
+        check_table(table, expected)
+    # the last level is the split table of the rules' 3 splits
+    check_table(easybj.calculate(Rules())['split'], BASELINE['split'])
+
+def test_default_dealer_and_advantage():
+    results = easybj.calculate(Rules())
+    for d in DEALER_CODE:
+        for k, v in BASELINE['dealer'][d].items():
+            assert float(results['dealer'][d][k]) == pytest.approx(v, abs=TOLERANCE)
+    assert results['advantage'] == pytest.approx(BASELINE['advantage'], abs=TOLERANCE)
+
+# largest difference of the per column EV tables of a shoe of many decks
+# from the infinite deck, over a few dealer columns
+def shoe_error(decks, columns):
+    infinite = easybj.Calculator()
+    infinite.run('optimal')
+    shoe = easybj.ShoeCalculator(shoe_counts(decks), columns=columns)
+    shoe.run('optimal')
+    index = [ DEALER_CODE.index(d) for d in columns ]
+    return max(np.nanmax(np.abs(getattr(shoe, a).table[:, index] -
+        getattr(infinite, a).table[:, index])) for a in
+        ('stand_ev', 'hit_ev', 'double_ev', 'split_ev3', 'optimal_ev'))
+
+def test_large_shoe_converges_to_infinite_deck():
+    # a dealer that stands and one that draws (the low columns take longer)
+    columns = [ '17', '20', 'A6' ]
+    small, large = shoe_error(64, columns), shoe_error(1024, columns)
+    assert large < 1e-3
+    # the difference shrinks about as 1 / decks
+    assert large < small / 8
+
+@pytest.mark.parametrize('rules', [ Rules(), Rules(hit_soft17=False,
+    max_splits=None, surrender=False) ])
+def test_parallel_equals_serial(rules):
+    serial = easybj.calculate(rules)
+    parallel = easybj.calculate(rules, workers=2)
+    for name in easybj.RESULTS:
+        a, b = serial[name], parallel[name]
+        if name == 'resplit':
+            assert len(a) == len(b)
+            pairs = zip(a, b)
+        elif name in ('dealer', 'advantage'):
+            assert a == b, name
+            continue
+        else:
+            pairs = [ (a, b) ]
+        for x, y in pairs:
+            if x.celltype is float:
+                assert np.array_equal(x.table, y.table, equal_nan=True), name
+            else:
+                assert [ x.row(p) for p in x.ylabels ] == \
+                    [ y.row(p) for p in y.ylabels ], name
+
+# shoes that leave dealer codes unreachable: no aces (no soft dealer
+# hands), and a single 2 (no dealer 4, no pair of 2s)
+@pytest.mark.parametrize('counts, unreachable', [
+    ((0, 4, 4, 4, 4, 4, 4, 4, 4, 16), [ 'AA', 'A2', 'A3', 'A4', 'A5', 'A6' ]),
+    ((4, 1, 4, 4, 4, 4, 4, 4, 4, 16), [ '4' ]),
+])
+def test_shoe_with_unreachable_cells(counts, unreachable):
+    results = easybj.calculate(counts=counts)
+    assert math.isfinite(results['advantage'])
+    assert np.nansum(results['initial'].table) == pytest.approx(1.)
+
+    optimal, strategy = results['optimal'], results['strategy']
+    for d in DEALER_CODE:
+        assert (not results['dealer'][d]) == (d in unreachable)
+        for p in optimal.ylabels:
+            # a cell is empty in every table or in none
+            assert (optimal[p,d] is None) == (strategy[p,d] is None), (p, d)
+            if d in unreachable:
+                assert optimal[p,d] is None
+    if counts[1] == 1:
+        assert all(v is None for v in strategy.row('22'))
+    reached = [ d for d in DEALER_CODE if d not in unreachable ]
+    assert all(strategy['16',d] is not None for d in reached)
+
+def test_recalculate_equals_fresh_calculator():
+    calc = easybj.Calculator(prob=shoe_counts(1))
+    for stage in easybj.STAGES:
+        calc.run(stage)
+    assert calc.recalculate(shoe_counts(1)) is calc
+
+    # remove cards one at a time as through a shoe
+    counts = list(shoe_counts(1))
+    for k in (9, 0, 4, 9):
+        counts[k] -= 1
+        calc = calc.recalculate(counts)
+        fresh = easybj.Calculator(prob=counts)
+        for stage in easybj.STAGES:
+            fresh.run(stage)
+        assert calc.prob == fresh.prob
+        assert calc.advantage == fresh.advantage
+        for attr in ('initprob', 'stand_ev', 'hit_ev', 'double_ev', 'split_ev3',
+                'optimal_ev'):
+            assert np.array_equal(getattr(calc, attr).table,
+                getattr(fresh, attr).table, equal_nan=True), attr
+        assert [ calc.strategy.row(p) for p in easybj.PLAYER_CODE ] == \
+            [ fresh.strategy.row(p) for p in easybj.PLAYER_CODE ]
+
+def test_parallel_shoe_equals_serial():
+    counts = shoe_counts(2)
+    serial = easybj.make_calculator(counts=counts)
+    for stage in easybj.STAGES:
+        serial.run(stage)
+    parallel = easybj.make_parallel_calculator(counts=counts, workers=2)
+    # the deals of the parent are freed like those of a serial run
+    assert parallel.deals == [] and not parallel.hit_memo
+    for stage in easybj.STAGES:
+        parallel.run(stage)
+
+    assert parallel.advantage == serial.advantage
+    assert dict(parallel.dealprob) == dict(serial.dealprob)
+    for attr in ('initprob', 'stand_ev', 'hit_ev', 'double_ev', 'split_ev0',
+            'split_ev3', 'optimal_ev'):
+        assert np.array_equal(getattr(parallel, attr).table,
+            getattr(serial, attr).table, equal_nan=True), attr
+    for a, b in zip(parallel.resplit, serial.resplit):
+        assert np.array_equal(a.table, b.table, equal_nan=True)
+    assert [ parallel.strategy.row(p) for p in easybj.PLAYER_CODE ] == \
+        [ serial.strategy.row(p) for p in easybj.PLAYER_CODE ]
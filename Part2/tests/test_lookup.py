@@ -0,0 +1,40 @@
+#
+# test_lookup.py
+#
+# Checks of the compiled strategy lookup
+#
+
+import itertools
+
+import numpy as np
+
+import easybj
+from easybj import DISTINCT
+from lookup import STAND, StrategyLookup, hand_states
+
+# every hand of two or three cards (rank indices, -1 padded) and its state
+HANDS = np.array([ list(h) + [ -1 ] * (3 - len(h)) for n in (2, 3)
+    for h in itertools.product(range(len(DISTINCT)), repeat=n) ])
+STATES = hand_states(HANDS)
+
+# every dealer hand of two cards
+DEALERS = np.array(list(itertools.product(range(len(DISTINCT)), repeat=2)))
+
+def test_21_stands():
+    lookup = StrategyLookup(easybj.calculate()['strategy'])
+    player = HANDS[STATES == 21]
+    # a two card 21 (a blackjack) is settled before any play, but has no
+    # decision either
+    assert len(player) > 0
+    rows = np.repeat(player, len(DEALERS), axis=0)
+    dealer = np.tile(DEALERS, (len(player), 1))
+    actions = lookup.actions_for_cards(rows, dealer)
+    assert (actions == STAND).all()
+
+def test_soft_and_hard_21_examples():
+    lookup = StrategyLookup(easybj.calculate()['strategy'])
+    cards = lambda s: [ DISTINCT.index(c) for c in s ]
+    player = np.array([ cards('T56'), cards('A55') ])
+    for d in DEALERS:
+        actions = lookup.actions_for_cards(player, np.array([ d, d ]))
+        assert (actions == STAND).all()
@@ -0,0 +1,17 @@
+#
+# test_main.py
+#
+# Checks of the command line printer
+#
+
+import easybj
+import main
+
+# main.py keeps its own copy of the result names so listing them does not
+# import the calculator
+def test_result_names_match_calculator():
+    assert main.RESULT_NAMES == tuple(easybj.RESULTS)
+
+def test_list_prints_every_result(capsys):
+    main.main(2, [ 'main.py', '--list' ])
+    assert capsys.readouterr().out.split() == list(easybj.RESULTS)
@@ -0,0 +1,62 @@
+#
+# test_server.py
+#
+# Checks of the result cache and shared calculations of the service
+#
+
+import asyncio
+
+from server import CalculationService, ResultCache, request_key
+
+def test_cache_evicts_least_recently_used_by_bytes():
+    cache = ResultCache(25)
+    cache.put('a', { 'x': '0123456789' })
+    cache.put('b', { 'x': '01234', 'y': '01234' })
+    assert cache.get('a') is not None   # a is now the most recently used
+    cache.put('c', { 'x': '0123456789' })
+    assert list(cache.entries) == [ 'a', 'c' ]
+    assert cache.bytes == 20
+
+def test_cache_replaces_entry_and_skips_oversized():
+    cache = ResultCache(25)
+    cache.put('a', { 'x': '0123456789' })
+    cache.put('a', { 'x': '01234' })
+    assert cache.bytes == 5
+    cache.put('big', { 'x': 'z' * 26 })
+    assert cache.get('big') is None
+    assert list(cache.entries) == [ 'a' ] and cache.bytes == 5
+
+def test_concurrent_requests_share_one_calculation():
+    service = CalculationService(1)
+    key = request_key({})
+
+    async def run():
+        first, second = await asyncio.gather(service.results(key), service.results(key))
+        third = await service.results(key)
+        return first, second, third
+
+    try:
+        first, second, third = asyncio.run(run())
+    finally:
+        service.close()
+    assert first is second is third
+    assert service.stats['calculations'] == 1
+    assert service.stats['coalesced'] == 1
+    assert service.stats['hits'] == 1
+    assert key in service.cache.entries and not service.pending
+
+def test_failed_calculation_is_not_cached():
+    service = CalculationService(1)
+    key = request_key({ 'counts': [ 0 ] * 10 })
+
+    async def run():
+        return await asyncio.gather(service.results(key), service.results(key),
+            return_exceptions=True)
+
+    try:
+        errors = asyncio.run(run())
+    finally:
+        service.close()
+    assert all(isinstance(e, Exception) for e in errors)
+    assert service.stats['calculations'] == 1
+    assert not service.cache.entries and not service.pending
@@ -0,0 +1,46 @@
+#
+# test_sweep.py
+#
+# Checks of resuming a rule sweep from its results file
+#
+
+import json
+
+import easybj
+from rules import Rules
+from sweep import load_done, make_record, sweep
+
+GRID = [ Rules(), Rules(hit_soft17=False), Rules(surrender=False) ]
+
+# return the line of the results file of a rule set
+def record_line(rules):
+    return json.dumps(make_record(rules, easybj.calculate(rules))) + '\n'
+
+def test_load_done_cuts_torn_last_line(tmp_path):
+    path = tmp_path / 'results.jsonl'
+    good = record_line(GRID[0]) + record_line(GRID[1])
+    torn = record_line(GRID[2])[:40]
+    path.write_text(good + torn)
+
+    assert load_done(str(path)) == { GRID[0], GRID[1] }
+    assert path.read_text() == good
+
+def test_load_done_cuts_whole_record_without_newline(tmp_path):
+    # a record cut just before its newline parses but was not finished
+    path = tmp_path / 'results.jsonl'
+    good = record_line(GRID[0])
+    path.write_text(good + record_line(GRID[1]).rstrip('\n'))
+
+    assert load_done(str(path)) == { GRID[0] }
+    assert path.read_text() == good
+
+def test_sweep_resumes_after_torn_line(tmp_path):
+    path = tmp_path / 'results.jsonl'
+    path.write_text(record_line(GRID[0]) + record_line(GRID[1])[:25])
+
+    assert sweep(GRID, str(path), workers=1) == 2
+    lines = path.read_text().splitlines()
+    assert sorted(json.dumps(json.loads(l)['rules'], sort_keys=True) for l in lines) == \
+        sorted(json.dumps(r._asdict(), sort_keys=True) for r in GRID)
+    # nothing left to do
+    assert sweep(GRID, str(path), workers=1) == 0